@@ -0,0 +1,222 @@
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from collections import Counter, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+#Players returned per page of /players, as API-Football does.
+PAGE_SIZE = 20
+
+class FakeFootballData:
+    """Deterministic synthetic API-Football data at a configurable scale."""
+
+    def __init__(self, leagues, seasons, teams_per_league, squad_size):
+        self.leagues = leagues
+        self.seasons = seasons
+        self.teams_per_league = teams_per_league
+        self.squad_size = squad_size
+
+    def team_ids(self, league):
+        return [league * 1000 + i for i in range(1, self.teams_per_league + 1)]
+
+    def all_team_ids(self):
+        return [t for league in self.leagues for t in self.team_ids(league)]
+
+    def squad(self, team_id, season):
+        #A fifth of each squad is replaced every season so players move between clubs.
+        rotation = (season - min(self.seasons)) * self.squad_size // 5
+        return [team_id * 1000 + (j + rotation) % (self.squad_size * 3) for j in range(self.squad_size)]
+
+    def teams(self, league, season):
+        return [{
+            "team": {"id": t, "name": f"Team {t}", "country": f"Country {league}", "founded": 1880 + t % 100},
+            "venue": {"name": f"Stadium {t}"},
+        } for t in self.team_ids(league)]
+
+    def coaches(self, team_id):
+        return [{"id": team_id * 10 + k, "name": f"Coach {team_id * 10 + k}", "nationality": "Nowhere"} for k in range(2)]
+
+    def players(self, team_id, season, page):
+        squad = self.squad(team_id, season)
+        chunk = squad[(page - 1) * PAGE_SIZE:page * PAGE_SIZE]
+        rng = random.Random(team_id * 10000 + season)
+        response = [{
+            "player": {"id": p, "name": f"Player {p}", "nationality": "Nowhere", "birth": {"date": f"199{p % 10}-0{1 + p % 9}-1{p % 10}"}},
+            "statistics": [{
+                "games": {"appearences": rng.randint(0, 38), "minutes": rng.randint(0, 3420)},
+                "goals": {"total": rng.randint(0, 25), "assists": rng.randint(0, 15)},
+            }],
+        } for p in chunk]
+        total = max(1, -(-len(squad) // PAGE_SIZE))
+        return response, {"current": page, "total": total}
+
+    def transfers(self, team_id):
+        teams = self.all_team_ids()
+        rng = random.Random(team_id)
+        response = []
+        for j in range(self.squad_size):
+            moves = []
+            for season in self.seasons:
+                other = rng.choice(teams)
+                fee = rng.choice(["Free", "Loan", f"€ {rng.randint(1, 90)}.{rng.randint(0, 9)}M", f"€ {rng.randint(100, 900)}K"])
+                moves.append({
+                    "date": f"{season}-0{rng.randint(7, 9)}-{rng.randint(10, 28)}",
+                    "type": fee,
+                    "teams": {"in": {"id": team_id}, "out": {"id": other}},
+                })
+            response.append({"player": {"id": team_id * 1000 + j}, "transfers": moves})
+        return response
+
+    def trophies(self, entity_id):
+        rng = random.Random(entity_id)
+        return [{
+            "league": rng.choice(["Premier League", "FA Cup", "League Cup", "Community Shield"]),
+            "season": str(rng.choice(self.seasons)),
+            "place": rng.choice(["Winner", "2nd Place", "Runner-up"]),
+        } for _ in range(rng.randint(0, 4))]
+
+class FakeAPIServer(ThreadingHTTPServer):
+    """Serves FakeFootballData with simulated latency, rate limits and injected errors."""
+
+    daemon_threads = True
+
+    def __init__(self, address, data, latency_ms=0, jitter_ms=0, rate_per_minute=0, rate_per_day=0, error_rate=0.0):
+        super().__init__(address, FakeAPIHandler)
+        self.data = data
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.rate_per_minute = rate_per_minute
+        self.rate_per_day = rate_per_day
+        self.error_rate = error_rate
+        self.recent = deque()
+        self.served_today = 0
+        self.stats = Counter()
+        self.lock = threading.Lock()
+
+    def admit(self):
+        """Applies the rate limits and returns (allowed, minute remaining, day remaining)."""
+        with self.lock:
+            now = time.monotonic()
+            while self.recent and now - self.recent[0] > 60:
+                self.recent.popleft()
+            if self.rate_per_day and self.served_today >= self.rate_per_day:
+                return False, 0, 0
+            if self.rate_per_minute and len(self.recent) >= self.rate_per_minute:
+                return False, 0, self.rate_per_day - self.served_today
+            self.recent.append(now)
+            self.served_today += 1
+            return True, self.rate_per_minute - len(self.recent), self.rate_per_day - self.served_today
+
+class FakeAPIHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload, headers=None):
+        body = json.dumps(payload).encode()
+        if "gzip" in self.headers.get("Accept-Encoding", ""):
+            body = gzip.compress(body, 5)
+            headers = dict(headers or {}, **{"Content-Encoding": "gzip"})
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, str(value))
+        self.end_headers()
+        self.wfile.write(body)
+        with self.server.lock:
+            self.server.stats["bytes"] += len(body)
+
+    def do_GET(self):
+        server = self.server
+        url = urlparse(self.path)
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        endpoint = url.path.strip("/")
+
+        if endpoint == "_stats":
+            with server.lock:
+                stats = dict(server.stats)
+            return self.send_json(200, stats)
+
+        if endpoint == "status":
+            #Like API-Football, the status endpoint is not rate limited or counted.
+            with server.lock:
+                used = server.served_today
+            return self.send_json(200, {"get": "status", "errors": [], "response": {
+                "requests": {"current": used, "limit_day": server.rate_per_day or 1000000}}})
+
+        if server.latency_ms or server.jitter_ms:
+            time.sleep((server.latency_ms + random.uniform(0, server.jitter_ms)) / 1000)
+
+        allowed, minute_left, day_left = server.admit()
+        headers = {}
+        if server.rate_per_minute:
+            headers.update({"x-ratelimit-limit": server.rate_per_minute, "x-ratelimit-remaining": max(0, minute_left)})
+        if server.rate_per_day:
+            headers.update({"x-ratelimit-requests-limit": server.rate_per_day, "x-ratelimit-requests-remaining": max(0, day_left)})
+        with server.lock:
+            server.stats["requests"] += 1
+            server.stats[f"requests:{endpoint}"] += 1
+        if not allowed:
+            with server.lock:
+                server.stats["rate_limited"] += 1
+            if day_left <= 0 and server.rate_per_day:
+                return self.send_json(200, {"errors": {"requests": "You have reached the request limit for the day."}, "response": []}, headers)
+            return self.send_json(429, {"errors": {"rateLimit": "Too many requests."}, "response": []}, headers)
+        if random.random() < server.error_rate:
+            with server.lock:
+                server.stats["errors_injected"] += 1
+            return self.send_json(500, {"errors": {"server": "Injected error."}}, headers)
+
+        payload = {"get": endpoint, "parameters": query, "errors": [], "paging": {"current": 1, "total": 1}}
+        data = server.data
+        if endpoint == "teams":
+            payload["response"] = data.teams(int(query["league"]), int(query["season"]))
+        elif endpoint == "coachs":
+            payload["response"] = data.coaches(int(query["team"]))
+        elif endpoint == "players":
+            response, paging = data.players(int(query["team"]), int(query["season"]), int(query.get("page", 1)))
+            payload["response"], payload["paging"] = response, paging
+        elif endpoint == "transfers":
+            payload["response"] = data.transfers(int(query["team"]))
+        elif endpoint == "trophies":
+            payload["response"] = data.trophies(int(query.get("player") or query.get("coach")))
+        else:
+            return self.send_json(404, {"errors": {"endpoint": f"Unknown endpoint {endpoint}."}})
+        payload["results"] = len(payload["response"])
+        self.send_json(200, payload, headers)
+
+#Defining a function to add the scale and behaviour options to a parser.
+def add_server_arguments(parser):
+    """Adds the fake server's scale, latency, rate limit and error options."""
+    int_list = lambda s: [int(x) for x in s.split(",")]
+    parser.add_argument("--leagues", type=int_list, default=[39], help="comma-separated league IDs")
+    parser.add_argument("--seasons", type=int_list, default=[2018, 2021], help="comma-separated seasons")
+    parser.add_argument("--teams", type=int, default=20, help="teams per league")
+    parser.add_argument("--squad", type=int, default=30, help="players per squad")
+    parser.add_argument("--latency-ms", type=float, default=0, help="fixed latency added to every response")
+    parser.add_argument("--jitter-ms", type=float, default=0, help="random extra latency up to this much")
+    parser.add_argument("--rate-per-minute", type=int, default=0, help="per-minute request limit (0 = none)")
+    parser.add_argument("--rate-per-day", type=int, default=0, help="daily request limit (0 = none)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with a 500")
+
+#Defining a function to build a server from parsed options.
+def make_server(args, host="127.0.0.1", port=0):
+    """Returns a FakeAPIServer configured from the parsed options."""
+    data = FakeFootballData(args.leagues, args.seasons, args.teams, args.squad)
+    return FakeAPIServer((host, port), data, args.latency_ms, args.jitter_ms,
+                         args.rate_per_minute, args.rate_per_day, args.error_rate)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve a local stand-in for the API-Football endpoints the loaders use.")
+    parser.add_argument("--port", type=int, default=8099)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    server = make_server(args, port=args.port)
+    print(f"Fake API-Football listening on http://127.0.0.1:{server.server_port}", flush=True)
+    server.serve_forever()
@@ -0,0 +1,180 @@
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from bench.fake_api import add_server_arguments
+
+#Tables each stage writes, for counting the rows it loaded.
+STAGE_TABLES = {
+    "teams": ["teams", "coaches", "coach_history"],
+    "players": ["players", "player_stats"],
+    "transfers": ["transfers"],
+    "trophies": ["trophies"],
+}
+
+#Defining a function to start the fake API in its own process.
+def start_fake_api(args):
+    """Starts bench.fake_api on a free port and returns (process, base url)."""
+    argv = [sys.executable, "-m", "bench.fake_api", "--port", "0",
+            "--leagues", ",".join(map(str, args.leagues)), "--seasons", ",".join(map(str, args.seasons)),
+            "--teams", str(args.teams), "--squad", str(args.squad),
+            "--latency-ms", str(args.latency_ms), "--jitter-ms", str(args.jitter_ms),
+            "--rate-per-minute", str(args.rate_per_minute), "--rate-per-day", str(args.rate_per_day),
+            "--error-rate", str(args.error_rate)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    process = subprocess.Popen(argv, cwd=root, stdout=subprocess.PIPE, text=True)
+    line = process.stdout.readline()
+    return process, line.strip().rsplit(" ", 1)[-1]
+
+#Defining a function to read the fake API's request counters.
+def server_stats(base_url):
+    """Returns the fake API's counters."""
+    with urllib.request.urlopen(f"{base_url}/_stats") as response:
+        return json.load(response)
+
+#Defining a function to count the rows in a set of tables.
+def count_rows(tables):
+    """Returns the total row count of the given tables."""
+    from utils.db import get_db_connection
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            total = 0
+            for table in tables:
+                cur.execute(f"SELECT COUNT(*) FROM {table};")
+                total += cur.fetchone()[0]
+    return total
+
+#Defining a function to reset the benchmark database.
+def reset_database():
+    """Drops and recreates the public schema of the benchmark database."""
+    from utils.db import get_db_connection
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DROP SCHEMA public CASCADE; CREATE SCHEMA public;")
+            conn.commit()
+
+#Defining a function to apply the benchmark's pipeline options.
+def apply_bench_options(args):
+    """Every benchmark run does the full amount of work over the fake API's leagues and seasons."""
+    from utils.cli import build_parser, apply_options
+    apply_options(build_parser("bench").parse_args([
+        "--full-refresh", "--shard-workers", str(args.shard_workers),
+        "--leagues", ",".join(map(str, args.leagues)), "--seasons", ",".join(map(str, args.seasons)),
+    ] + (["--profile"] if args.profile else [])))
+
+#Defining a function to benchmark one stage in this process.
+def measure_stage(args, base_url, stage):
+    """Runs one stage and returns its result dict; run_benchmark calls it in a fresh process per stage."""
+    import run_all
+    from utils import shard
+    apply_bench_options(args)
+    tables = STAGE_TABLES.get(stage, [])
+    rows_before = count_rows(tables)
+    requests_before = server_stats(base_url)
+    start = time.perf_counter()
+    run_all.run_stages([stage], args.seasons, args.workers)
+    wall = time.perf_counter() - start
+    requests_after = server_stats(base_url)
+    rows = count_rows(tables) - rows_before
+    requests = requests_after.get("requests", 0) - requests_before.get("requests", 0)
+    #Shard workers only count towards RUSAGE_CHILDREN once they have exited.
+    shard.shutdown()
+    return {
+        "stage": stage,
+        "wall_seconds": round(wall, 3),
+        "requests": requests,
+        "requests_per_second": round(requests / wall, 1) if wall else 0.0,
+        "rows": rows,
+        "rows_per_second": round(rows / wall, 1) if wall else 0.0,
+        "rate_limited": requests_after.get("rate_limited", 0) - requests_before.get("rate_limited", 0),
+        "bytes": requests_after.get("bytes", 0) - requests_before.get("bytes", 0),
+        #ru_maxrss is a high-water mark in KiB on Linux: this stage's process, and its largest shard worker.
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+        "worker_peak_rss_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / 1024, 1),
+    }
+
+#Defining a function to benchmark each stage against the fake API.
+def run_benchmark(args, base_url):
+    """Runs the selected stages one at a time, each in a fresh process, and returns a result dict per stage."""
+    import run_all
+    apply_bench_options(args)
+    if not args.no_reset:
+        reset_database()
+    run_all.create_schema()
+
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    results = []
+    for stage in run_all.select_stages(args.only):
+        #A fresh process per stage, so its peak RSS is its own rather than the highest of the stages before it.
+        with tempfile.TemporaryDirectory() as tmp:
+            result_file = os.path.join(tmp, "result.json")
+            subprocess.run([sys.executable, "-m", "bench.run_bench", *sys.argv[1:],
+                            "--stage", stage, "--api-url", base_url, "--result-file", result_file],
+                           cwd=root, check=True)
+            with open(result_file) as f:
+                results.append(json.load(f))
+    return results
+
+#Defining a function to print the benchmark report.
+def print_report(results):
+    """Prints one row per stage."""
+    print(f"\n{'stage':<10} {'wall s':>8} {'requests':>9} {'req/s':>8} {'rows':>9} {'rows/s':>10} {'429s':>5} "
+          f"{'peak RSS MB':>12} {'worker MB':>10}")
+    for r in results:
+        print(f"{r['stage']:<10} {r['wall_seconds']:>8.2f} {r['requests']:>9} {r['requests_per_second']:>8.1f} "
+              f"{r['rows']:>9} {r['rows_per_second']:>10.1f} {r['rate_limited']:>5} {r['peak_rss_mb']:>12.1f} "
+              f"{r['worker_peak_rss_mb']:>10.1f}")
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the loaders against a local fake API and a local Postgres.")
+    parser.add_argument("--db-url", default=os.getenv("BENCH_DB_URL"), help="benchmark database URL (or BENCH_DB_URL); it is wiped")
+    parser.add_argument("--no-reset", action="store_true", help="keep the benchmark database's existing data")
+    parser.add_argument("--only", type=lambda s: s.split(","), help="comma-separated stages to benchmark")
+    parser.add_argument("--workers", type=int, default=4, help="stage partitions run at the same time")
+    parser.add_argument("--shard-workers", type=int, default=1, help="processes each stage partition's work is split across")
+    parser.add_argument("--json", help="also write the results to this JSON file")
+    parser.add_argument("--profile", action="store_true", help="profile each stage (see run_all.py --profile); profiling slows the run")
+    #Used by run_benchmark to run one stage in a child process.
+    parser.add_argument("--stage", help=argparse.SUPPRESS)
+    parser.add_argument("--api-url", help=argparse.SUPPRESS)
+    parser.add_argument("--result-file", help=argparse.SUPPRESS)
+    add_server_arguments(parser)
+    args = parser.parse_args()
+    if args.stage:
+        #The parent has already pointed the environment at the fake API and the benchmark database.
+        result = measure_stage(args, args.api_url, args.stage)
+        with open(args.result_file, "w") as f:
+            json.dump(result, f)
+        exit(0)
+    if not args.db_url:
+        parser.error("a benchmark database is required: pass --db-url or set BENCH_DB_URL")
+    if args.db_url == os.getenv("NEON_DB_URL") and not args.no_reset:
+        parser.error("refusing to wipe the database in NEON_DB_URL; point --db-url at a local Postgres")
+
+    process, base_url = start_fake_api(args)
+    try:
+        #The loaders read their settings at import time, so point them at the fake API first.
+        os.environ.update({
+            "API_KEY": "bench",
+            "API_BASE_URL": base_url,
+            "NEON_DB_URL": args.db_url,
+            "API_CACHE": "0",
+            "API_ARCHIVE": "0",
+            "API_RATE_PER_MINUTE": str(args.rate_per_minute or 1_000_000),
+            "API_RATE_PER_DAY": str(args.rate_per_day or 1_000_000_000),
+        })
+        results = run_benchmark(args, base_url)
+        print_report(results)
+        if args.json:
+            with open(args.json, "w") as f:
+                json.dump({"config": vars(args) | {"db_url": None}, "stages": results}, f, indent=2)
+    finally:
+        process.terminate()
+        process.wait()
@@ -0,0 +1,191 @@
+import os
+import json
+import time
+import shutil
+from datetime import datetime, timezone
+import pyarrow as pa
+import pyarrow.parquet as pq
+from dotenv import load_dotenv
+from utils.db import get_db_connection
+from utils.metrics import metrics
+from utils.profiling import profile_stage
+from utils.cli import build_parser, apply_options
+from utils import config
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Where the datasets are written, in which format, and how many rows go into each row group.
+EXPORT_DIR = os.getenv("EXPORT_DIR", "exports")
+EXPORT_FORMAT = os.getenv("EXPORT_FORMAT", "parquet")
+EXPORT_COMPRESSION = os.getenv("EXPORT_COMPRESSION", "zstd")
+EXPORT_BATCH_ROWS = int(os.getenv("EXPORT_BATCH_ROWS", "50000"))
+
+#Exported tables and the column their dataset is partitioned by (None for one file per table).
+EXPORT_TABLES = {
+    "teams": None,
+    "players": None,
+    "player_stats": "season",
+    "transfers": "season",
+    "coach_history": "season",
+    "trophies": None,
+}
+
+#Arrow type of each Postgres column type, and the cast it is read with where psycopg2's type does not fit.
+ARROW_TYPES = {
+    "smallint": (pa.int16(), ""),
+    "integer": (pa.int32(), ""),
+    "bigint": (pa.int64(), ""),
+    "numeric": (pa.float64(), "::float8"),
+    "double precision": (pa.float64(), ""),
+    "real": (pa.float32(), ""),
+    "boolean": (pa.bool_(), ""),
+    "date": (pa.date32(), ""),
+    "timestamp with time zone": (pa.timestamp("us", tz="UTC"), ""),
+    "timestamp without time zone": (pa.timestamp("us"), ""),
+}
+
+#Defining a function to read a table's columns.
+def table_schema(cur, table):
+    """Returns the table's column names, their SELECT expressions and the matching Arrow schema."""
+    cur.execute("""
+        SELECT column_name, data_type FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = %s
+        ORDER BY ordinal_position;
+    """, (table,))
+    columns, selects, fields = [], [], []
+    for name, data_type in cur.fetchall():
+        arrow_type, cast = ARROW_TYPES.get(data_type, (pa.string(), "::text"))
+        columns.append(name)
+        selects.append(f"{name}{cast}")
+        fields.append(pa.field(name, arrow_type))
+    return columns, selects, pa.schema(fields)
+
+#Defining a function to fingerprint what would be exported.
+def fingerprints(cur, table, partition_column, seasons):
+    """Returns {partition: (rows, fingerprint)} for the table's seasons (or the whole table), computed in the database."""
+    #An order-independent hash over every row changes whenever a row is added, removed or edited.
+    if partition_column is None:
+        cur.execute(f"SELECT COUNT(*), COALESCE(SUM(hashtext(t::text)::bigint), 0) FROM {table} t;")
+        rows, digest = cur.fetchone()
+        return {"all": (rows, f"{rows}:{digest}")}
+    cur.execute(f"""
+        SELECT {partition_column}, COUNT(*), COALESCE(SUM(hashtext(t::text)::bigint), 0)
+        FROM {table} t WHERE {partition_column} = ANY(%s)
+        GROUP BY {partition_column};
+    """, (list(seasons),))
+    found = {str(season): (rows, f"{rows}:{digest}") for season, rows, digest in cur.fetchall()}
+    #Seasons without rows are listed too, so a dataset emptied in the database is removed.
+    return {str(season): found.get(str(season), (0, "0:0")) for season in seasons}
+
+#Defining a function to open a dataset file for writing.
+def _open_writer(path, schema):
+    if EXPORT_FORMAT == "arrow":
+        #Arrow IPC files can be memory-mapped and read without decoding.
+        return pa.ipc.new_file(path, schema)
+    return pq.ParquetWriter(path, schema, compression=EXPORT_COMPRESSION)
+
+#Defining a function to stream one table or season into a file.
+def write_partition(conn, table, selects, columns, schema, where, params, path):
+    """Streams the selected rows through a server-side cursor into a dataset file, one row group per batch, and returns the row count."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp = f"{path}.tmp"
+    rows = 0
+    #A named cursor keeps the result on the server, so only one batch is in memory at a time.
+    with conn.cursor(name=f"export_{table}") as cur:
+        cur.itersize = EXPORT_BATCH_ROWS
+        cur.execute(f"SELECT {', '.join(selects)} FROM {table} {where};", params)
+        writer = _open_writer(tmp, schema)
+        try:
+            while True:
+                batch = cur.fetchmany(EXPORT_BATCH_ROWS)
+                if not batch:
+                    break
+                arrays = [pa.array(values, type=field.type) for values, field in zip(zip(*batch), schema)]
+                writer.write_table(pa.Table.from_arrays(arrays, names=columns))
+                rows += len(batch)
+        finally:
+            writer.close()
+    #Readers see either the previous file or the complete new one.
+    os.replace(tmp, path)
+    return rows
+
+#Defining a function to load the export manifest.
+def load_manifest():
+    """Returns what was exported last time, per table and partition."""
+    try:
+        with open(os.path.join(EXPORT_DIR, "_manifest.json")) as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {}
+
+#Defining a function to save the export manifest.
+def save_manifest(manifest):
+    """Writes the manifest next to the datasets."""
+    path = os.path.join(EXPORT_DIR, "_manifest.json")
+    with open(f"{path}.tmp", "w") as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(f"{path}.tmp", path)
+
+#Defining a function to export one table.
+def export_table(table, partition_column, seasons, manifest):
+    """Writes the table's changed seasons (or the whole table, if it changed) and updates the manifest."""
+    extension = "arrow" if EXPORT_FORMAT == "arrow" else "parquet"
+    exported = manifest.setdefault(table, {})
+    with get_db_connection() as conn:
+        #One snapshot for the fingerprints and the rows, so they always match.
+        conn.set_session(isolation_level="REPEATABLE READ", readonly=True)
+        try:
+            with conn.cursor() as cur:
+                columns, selects, schema = table_schema(cur, table)
+                current = fingerprints(cur, table, partition_column, seasons)
+            for partition, (rows, digest) in current.items():
+                if partition_column is None:
+                    directory, where, params = os.path.join(EXPORT_DIR, table), "", None
+                else:
+                    directory = os.path.join(EXPORT_DIR, table, f"{partition_column}={partition}")
+                    where, params = f"WHERE {partition_column} = %s", (int(partition),)
+                path = os.path.join(directory, f"part-0.{extension}")
+                previous = exported.get(partition, {})
+                if previous.get("fingerprint") == digest and previous.get("format") == EXPORT_FORMAT and os.path.exists(path):
+                    continue
+                if rows == 0:
+                    shutil.rmtree(directory, ignore_errors=True)
+                    exported.pop(partition, None)
+                    continue
+                start = time.perf_counter()
+                with metrics.span("export", table=table):
+                    written = write_partition(conn, table, selects, columns, schema, where, params, path)
+                #A file left over from the other format would be read as a second copy of the rows.
+                for name in os.listdir(directory):
+                    if name.startswith("part-") and name != os.path.basename(path):
+                        os.remove(os.path.join(directory, name))
+                metrics.inc("export_rows", written, table=table)
+                exported[partition] = {"fingerprint": digest, "rows": written, "format": EXPORT_FORMAT,
+                                       "exported_at": datetime.now(timezone.utc).isoformat()}
+                label = table if partition_column is None else f"{table} {partition_column}={partition}"
+                print(f"    [export] {label}: {written:,} rows in {time.perf_counter() - start:.2f}s")
+        finally:
+            conn.rollback()
+            conn.set_session(isolation_level="DEFAULT", readonly="DEFAULT")
+
+#Defining a function to run the whole stage.
+def run(seasons=None):
+    """Exports every table as a dataset, rewriting only the seasons and tables that changed since the last export."""
+    seasons = list(seasons or config.SEASONS)
+    print(f"📤 Exporting {len(EXPORT_TABLES)} tables to {EXPORT_DIR}/ as {EXPORT_FORMAT}...")
+    os.makedirs(EXPORT_DIR, exist_ok=True)
+    manifest = load_manifest()
+    for table, partition_column in EXPORT_TABLES.items():
+        try:
+            export_table(table, partition_column, seasons, manifest)
+        except Exception as e:
+            print(f"Error exporting {table}: {e}")
+        #Saved after every table, so an interrupted export only redoes the table it was on.
+        save_manifest(manifest)
+
+if __name__ == "__main__":
+    args = build_parser("Export the loaded tables as Parquet or Arrow datasets.").parse_args()
+    apply_options(args)
+    with profile_stage("export"):
+        run(args.seasons)
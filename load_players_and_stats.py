@@ -1,123 +1,150 @@
 import requests
-from utils.db import get_db_connection
-from utils.api import HEADERS
-import time
+from collections import namedtuple
+from utils.db import get_db_connection, bulk_upsert, fetch_teams_for_season, fetch_coached_teams_for_season, ensure_season_partitions
+from utils.api import client
+from utils.fetch import fetch_all
+from utils.sync import SyncTracker, content_hash
+from utils.checkpoint import Checkpoint, start_checkpoint
+from utils.shard import run_sharded
+from utils.stream import StreamWriter
+from utils.profiling import profile_stage, track_allocations
+from utils.metrics import metrics
+from utils.aggregates import refresh_aggregates
+from utils.cli import build_parser, apply_options
+from utils import config
 
-LEAGUE_ID = 39
-SEASONS = [2018, 2021]
-
-#Defining a function to fetch teams for a given season from the database.
-def fetch_teams_for_season(season):
-    """Fetches all teams for a given season from the database."""
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT DISTINCT team_id FROM coach_history WHERE season = %s;", (season,))
-                teams = [row[0] for row in cur.fetchall()]
-        return teams
-    except Exception as e:
-        print(f"Error fetching teams for season {season} from DB: {e}")
-        return []
+#Rows the formatter yields; the field names are the table columns.
+Player = namedtuple("Player", ["player_id", "name", "nationality", "birthdate"])
+PlayerStat = namedtuple("PlayerStat", ["player_id", "team_id", "season", "appearances", "goals", "assists", "minutes_played"])
 
 #Defining a function to get players for a given team and season.
-def get_players_for_team(team_id, season):
-    """Fetches all players for a given team and season from the API."""
-    url = f"https://v3.football.api-sports.io/players?team={team_id}&season={season}"
+def get_players_for_team(team_id, season, page=1):
+    """Fetches one page of players for a given team and season from the API."""
+    params = {"team": team_id, "season": season}
+    #Page 1 is requested without a page parameter so its URL matches earlier runs' cache and archive.
+    if page > 1:
+        params["page"] = page
     try:
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
+        return client.get("players", **params)
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching players for team {team_id}, season {season}: {e}")
+        print(f"Error fetching players for team {team_id}, season {season}, page {page}: {e}")
         return None
 
+#Defining a function to list the pages still to fetch after the first one.
+def remaining_pages(unit, data):
+    """Returns the (team_id, page) units for pages 2..paging.total once page 1 has arrived."""
+    team_id, page = unit
+    if page != 1 or not data:
+        return []
+    total = (data.get("paging") or {}).get("total") or 1
+    return [(team_id, p) for p in range(2, total + 1)]
+
 #Defining a function to format the players and their stats.
+@track_allocations
 def format_players_and_stats(data, team_id, season):
-    """Formats the players and their stats and returns a list of dictionaries."""
-    players = []
-    stats = []
+    """Formats the players and their stats, yielding a Player and a PlayerStat record per player."""
     if not data or "response" not in data:
-        return players, stats
-    
+        return
+
     #Looping through the players in the response.
     for item in data["response"]:
         p_info = item["player"]
         s_info = item["statistics"][0]
 
-        players.append({
-            "player_id": p_info.get("id"),
-            "name": p_info.get("name"),
-            "nationality": p_info.get("nationality"),
-            "birthdate": p_info.get("birth", {}).get("date")
-        })
+        yield Player(p_info.get("id"), p_info.get("name"), p_info.get("nationality"),
+                     p_info.get("birth", {}).get("date"))
 
         games = s_info.get("games", {})
         goals = s_info.get("goals", {})
-        stats.append({
-            "player_id": p_info.get("id"),
-            "team_id": team_id,
-            "season": season,
-            "appearances": games.get("appearences"),
-            "goals": goals.get("total"),
-            "assists": goals.get("assists"),
-            "minutes_played": games.get("minutes")
-        })
-    return players, stats
+        yield PlayerStat(p_info.get("id"), team_id, season, games.get("appearences"),
+                         goals.get("total"), goals.get("assists"), games.get("minutes"))
 
 #Defining a function to insert the players and their stats into the database.
+@track_allocations
 def insert_players_and_stats(players, stats):
-    """Inserts a list of players and their stats into the database."""
-    if not players:
-        return
+    """Inserts a list of players and their stats into the database and returns True on success."""
+    #A batch can end between a player and their stats, so either list may be empty on its own.
+    if not players and not stats:
+        return True
+    #One statement may only update a row once, so the last record per key wins.
+    stats = list({(s.player_id, s.team_id, s.season): s for s in stats}.values())
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                #Looping through the players.
-                for p in players:
-                    cur.execute("""
-                        INSERT INTO players (player_id, name, nationality, birthdate)
-                        VALUES (%s, %s, %s, %s)
-                        ON CONFLICT (player_id) DO NOTHING;
-                    """, (
-                        p["player_id"],
-                        p["name"],
-                        p["nationality"],
-                        p["birthdate"]
-                    ))
-                
-                #Looping through the player stats.
-                for s in stats:
-                    cur.execute("""
-                        INSERT INTO player_stats (player_id, team_id, season, appearances, goals, assists, minutes_played)
-                        VALUES (%s, %s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (player_id, team_id, season) DO NOTHING;
-                    """, (
-                        s["player_id"],
-                        s["team_id"],
-                        s["season"],
-                        s["appearances"],
-                        s["goals"],
-                        s["assists"],
-                        s["minutes_played"]
-                    ))
+                bulk_upsert(cur, "players", Player._fields, players, ["player_id"])
+                bulk_upsert(cur, "player_stats", PlayerStat._fields, stats, ["player_id", "team_id", "season"],
+                            update_columns=["appearances", "goals", "assists", "minutes_played"])
                 conn.commit()
+                return True
     except Exception as e:
         print(f"Error inserting players and stats: {e}")
+        return False
 
-#Looping through the seasons.
-for season in SEASONS:
+#Defining a function to write one batch of streamed records.
+def write_players(rows):
+    """Inserts a batch of Player and PlayerStat records and returns True on success."""
+    return insert_players_and_stats(rows.get(Player, []), rows.get(PlayerStat, []))
+
+#Defining a function to load the players and their stats for one season.
+def load_season(season):
+    """Fetches and loads the players and stats of every team of the configured leagues in a season."""
     print(f"-- Processing Season: {season} --")
-    team_ids = fetch_teams_for_season(season)
+    team_ids = fetch_teams_for_season(season, config.LEAGUES)
+    if not team_ids:
+        #Seasons loaded before league_teams existed only have their teams in coach_history.
+        team_ids = fetch_coached_teams_for_season(season)
     if not team_ids:
         print(f"No teams found for season {season}. Run the teams and coaches loader first.")
-        continue
+        return
+    ensure_season_partitions([season])
+    start_checkpoint("players", season)
+    changed = run_sharded(load_players, season, team_ids)
+    refresh_aggregates("players", [season], set().union(*changed))
+
+#Defining a function to load the players and their stats of some teams for one season.
+def load_players(season, team_ids):
+    """Fetches and loads the players and stats of the given teams for a season and returns the teams whose data changed."""
+    #Fetching page 1 of every stale, unfinished team, then each team's remaining pages, concurrently.
+    players_sync = SyncTracker("players")
+    checkpoint = Checkpoint("players", season)
+    todo_ids = checkpoint.todo(players_sync.stale(team_ids, season))
+    print(f"  -> Fetching players for {len(todo_ids)} of {len(team_ids)} teams...")
+    pages_left, page_hashes, failed, changed_ids = {}, {}, set(), set()
+    units = [(team_id, 1) for team_id in todo_ids]
+    #Each page is formatted as soon as it arrives and streamed to the writer thread.
+    with StreamWriter(write_players, players_sync, checkpoint) as writer:
+        for (team_id, page), players_data in fetch_all(lambda u: get_players_for_team(u[0], season, u[1]),
+                                                         units, expand=remaining_pages):
+            if page == 1:
+                pages_left[team_id] = len(remaining_pages((team_id, 1), players_data)) + 1
+                page_hashes[team_id] = {}
+            pages_left[team_id] -= 1
+            if players_data is None:
+                failed.add(team_id)
+                checkpoint.failed(team_id, f"API request for page {page} failed")
+            else:
+                page_hashes[team_id][page] = content_hash(players_data)
+                writer.put_all(metrics.timed(format_players_and_stats(players_data, team_id, season), "format", entity="players"), team_id)
+
+            #A team is done once every one of its pages has arrived.
+            if pages_left[team_id] == 0 and team_id not in failed:
+                hashes = page_hashes.pop(team_id)
+                changed, digest = players_sync.check(team_id, season, [hashes[p] for p in sorted(hashes)])
+                if changed:
+                    changed_ids.add(team_id)
+                writer.done(team_id, season, digest)
+    print(f"Wrote {writer.written['Player']} players ({writer.report('players')}) and "
+          f"{writer.written['PlayerStat']} stats ({writer.report('player_stats')}).")
+    return changed_ids
+
+#Defining a function to run the whole stage.
+def run(seasons=None):
+    """Loads the players and their stats for every season."""
+    for season in seasons or config.SEASONS:
+        load_season(season)
 
-    #Looping through the teams.
-    for team_id in team_ids:
-        print(f"  -> Fetching players for team {team_id}...")
-        players_data = get_players_for_team(team_id, season)
-        if players_data:
-            players, stats = format_players_and_stats(players_data, team_id, season)
-            insert_players_and_stats(players, stats)
-            print(f"Inserted/updated {len(players)} players and their stats.")
-        time.sleep(1.5)
\ No newline at end of file
+if __name__ == "__main__":
+    args = build_parser("Load players and their stats.").parse_args()
+    apply_options(args)
+    with profile_stage("players"):
+        run(args.seasons)
@@ -1,158 +1,179 @@
 import requests
-from utils.db import get_db_connection
-from utils.api import HEADERS
-import time
+from collections import namedtuple
+from utils.db import get_db_connection, bulk_upsert, fetch_teams_for_season
+from utils.api import client
+from utils.fetch import fetch_all
+from utils.sync import SyncTracker
+from utils.checkpoint import Checkpoint, start_checkpoint
+from utils.shard import run_sharded
+from utils.stream import StreamWriter
+from utils.profiling import profile_stage, track_allocations
+from utils.metrics import metrics, describe_rows
+from utils.queries import invalidate
+from utils.cli import build_parser, apply_options
+from utils import config
 
-LEAGUE_ID = 39
-SEASONS = [2018, 2021]
+#Rows the formatters yield; the field names are the table columns.
+Team = namedtuple("Team", ["team_id", "name", "country", "founded", "stadium_name"])
+Coach = namedtuple("Coach", ["coach_id", "name", "nationality"])
+CoachHistory = namedtuple("CoachHistory", ["coach_id", "team_id", "season"])
 
-#Defining a function to get teams for a given season.
-def get_teams_for_season(season):
-    """Fetches all teams for a given season from the API."""
-    url = f"https://v3.football.api-sports.io/teams?league={LEAGUE_ID}&season={season}"
+#Defining a function to get teams for a given league and season.
+def get_teams_for_season(season, league_id):
+    """Fetches all teams of a league for a given season from the API."""
     try:
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
+        return client.get("teams", league=league_id, season=season)
     except requests.exceptions.RequestException as e:
-        print(f"Error fetching teams for season {season}: {e}")
+        print(f"Error fetching teams for league {league_id}, season {season}: {e}")
         return None
 
 #Defining a function to get coaches for a given team.
 def get_coaches_for_team(team_id, season):
     """Fetches all coaches for a given team from the API."""
-    url = f"https://v3.football.api-sports.io/coachs?team={team_id}" 
     try:
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
+        return client.get("coachs", team=team_id)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching coaches for team {team_id}: {e}")
         return None
 
 #Defining a function to format the teams data.
+@track_allocations
 def format_teams(data):
-    """Formats the teams data and returns a list of dictionaries."""
-    teams = []
+    """Formats the teams data, yielding a Team record per team."""
     if not data or "response" not in data:
-        return teams
+        return
     #Looping through the teams in the response.
     for item in data["response"]:
         team_info = item["team"]
         venue = item["venue"]
-        teams.append({
-            "team_id": team_info["id"],
-            "name": team_info["name"],
-            "country": team_info["country"],
-            "founded": team_info["founded"],
-            "stadium_name": venue["name"]
-        })
-    return teams
+        yield Team(team_info["id"], team_info["name"], team_info["country"], team_info["founded"], venue["name"])
 
 #Defining a function to format the coaches and their history.
+@track_allocations
 def format_coaches_and_history(data, team_id, season):
-    """Formats the coaches and their history and returns a list of dictionaries."""
-    coaches = []
-    history = []
+    """Formats the coaches and their history, yielding a Coach and a CoachHistory record per coach."""
     if not data or not data.get("response"):
-        return coaches, history
+        return
 
-    #Looping through the coaches in the response.
+    #Looping through the coaches in the response; coaches without an ID cannot be stored.
     for item in data["response"]:
-        coaches.append({
-            "coach_id": item.get("id"),
-            "name": item.get("name"),
-            "nationality": item.get("nationality"),
-        })
-        history.append({
-            "coach_id": item.get("id"),
-            "team_id": team_id,
-            "season": season
-        })
-    return coaches, history
+        if not item.get("id"):
+            continue
+        yield Coach(item["id"], item.get("name"), item.get("nationality"))
+        yield CoachHistory(item["id"], team_id, season)
 
 #Defining a function to insert the teams into the database.
-def insert_teams(teams):
-    """Inserts a list of teams into the database."""
+@track_allocations
+def insert_teams(teams, league_id, season):
+    """Inserts a list of teams and their league membership into the database and returns True on success."""
     if not teams:
-        return
+        return True
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                #Looping through the teams.
-                for team in teams:
-                    cur.execute("""
-                        INSERT INTO teams (team_id, name, country, founded, stadium_name)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (team_id) DO NOTHING;
-                    """, (
-                        team["team_id"],
-                        team["name"],
-                        team["country"],
-                        team["founded"],
-                        team["stadium_name"]
-                    ))
+                bulk_upsert(cur, "teams", Team._fields, teams, ["team_id"])
+                bulk_upsert(cur, "league_teams",
+                            ["league_id", "season", "team_id"],
+                            [(league_id, season, team.team_id) for team in teams],
+                            ["league_id", "season", "team_id"])
                 conn.commit()
+                return True
     except Exception as e:
         print(f"Error inserting teams: {e}")
+        return False
 
 #Defining a function to insert the coaches and their history into the database.
+@track_allocations
 def insert_coaches_and_history(coaches, history):
-    """Inserts a list of coaches and their history into the database."""
+    """Inserts a list of coaches and their history into the database and returns True on success."""
     if not coaches and not history:
-        return
+        return True
 
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                #Looping through the coaches.
-                for coach in coaches:
-                    if not coach.get("coach_id"):
-                        continue
-                    cur.execute("""
-                        INSERT INTO coaches (coach_id, name, nationality)
-                        VALUES (%s, %s, %s)
-                        ON CONFLICT (coach_id) DO NOTHING;
-                    """, (
-                        coach["coach_id"],
-                        coach["name"],
-                        coach["nationality"]
-                    ))
-                
-                #Looping through the coach history.
-                for hist in history:
-                    if not all(k in hist for k in ["coach_id", "team_id", "season"]):
-                        continue
-                    cur.execute("""
-                        INSERT INTO coach_history (coach_id, team_id, season)
-                        VALUES (%s, %s, %s)
-                        ON CONFLICT (coach_id, team_id, season) DO NOTHING;
-                    """, (
-                        hist["coach_id"],
-                        hist["team_id"],
-                        hist["season"]
-                    ))
+                bulk_upsert(cur, "coaches", Coach._fields, coaches, ["coach_id"])
+                bulk_upsert(cur, "coach_history", CoachHistory._fields, history, ["coach_id", "team_id", "season"])
                 conn.commit()
+                return True
     except Exception as e:
         print(f"Error inserting coach data: {e}")
+        return False
+
+#Defining a function to write one batch of streamed records.
+def write_coaches(rows):
+    """Inserts a batch of Coach and CoachHistory records and returns True on success."""
+    return insert_coaches_and_history(rows.get(Coach, []), rows.get(CoachHistory, []))
 
-#Looping through the seasons.
-for season in SEASONS:
+#Defining a function to load the teams and coaches for one season.
+def load_season(season):
+    """Fetches and loads the teams of every configured league in a season, then the teams' coaches."""
     print(f"-- Processing Season: {season} --")
-    print("📡 Fetching Premier League teams...")
-    teams_data = get_teams_for_season(season)
-    if teams_data:
-        teams = format_teams(teams_data)
-        insert_teams(teams)
-        print(f"Inserted/updated {len(teams)} teams.")
-
-        #Looping through the teams.
-        for team in teams:
-            team_id = team["team_id"]
-            print(f"  -> Fetching coaches for team {team_id}...")
-            coach_data = get_coaches_for_team(team_id, season)
-            if coach_data:
-                coaches, history = format_coaches_and_history(coach_data, team_id, season)
-                insert_coaches_and_history(coaches, history)
-                print(f"Inserted/updated {len(coaches)} coaches and their history.")
-            time.sleep(1.5)
\ No newline at end of file
+    teams_sync = SyncTracker("teams")
+    team_ids, changed_ids = set(), set()
+
+    for league_id in config.LEAGUES:
+        known = fetch_teams_for_season(season, [league_id])
+        #A fresh team list is taken from the database; one loaded before league_teams existed is fetched again to record its league.
+        if known and teams_sync.is_fresh(league_id, season):
+            team_ids.update(known)
+            continue
+        print(f"📡 Fetching teams of league {league_id}...")
+        teams_data = get_teams_for_season(season, league_id)
+        if not teams_data:
+            continue
+        teams = list(metrics.timed(format_teams(teams_data), "format", entity="teams"))
+        team_ids.update(team.team_id for team in teams)
+        #An unchanged team list only needs its sync time bumped.
+        changed = teams_sync.record(league_id, season, teams_data)
+        if not changed and known:
+            teams_sync.flush()
+            print(f"Team list of league {league_id} is unchanged.")
+            continue
+        if changed:
+            changed_ids.update(team.team_id for team in teams)
+        with metrics.capture("db_rows", "table", "outcome") as rows:
+            if insert_teams(teams, league_id, season):
+                teams_sync.flush()
+        print(f"Wrote {len(teams)} teams: {describe_rows(rows, 'teams')}.")
+
+    start_checkpoint("coachs", season)
+    changed_ids.update(*run_sharded(load_coaches, season, sorted(team_ids)))
+    #Cached dashboard results showing these teams are out of date now.
+    invalidate([f"team:{team_id}" for team_id in changed_ids])
+
+#Defining a function to load the coaches of some teams for one season.
+def load_coaches(season, team_ids):
+    """Fetches and loads the coaches of the given teams for a season and returns the teams whose coaches changed."""
+    coaches_sync = SyncTracker("coachs")
+    changed_ids = set()
+
+    #Fetching every stale, unfinished team's coaches concurrently under the shared rate limiter.
+    checkpoint = Checkpoint("coachs", season)
+    todo_ids = checkpoint.todo(coaches_sync.stale(team_ids, season))
+    print(f"  -> Fetching coaches for {len(todo_ids)} of {len(team_ids)} teams...")
+    with StreamWriter(write_coaches, coaches_sync, checkpoint) as writer:
+        for team_id, coach_data in fetch_all(lambda t: get_coaches_for_team(t, season), todo_ids):
+            if coach_data is None:
+                checkpoint.failed(team_id, "API request failed")
+                continue
+            changed, digest = coaches_sync.check(team_id, season, coach_data)
+            if changed:
+                changed_ids.add(team_id)
+                writer.put_all(metrics.timed(format_coaches_and_history(coach_data, team_id, season), "format", entity="coaches"), team_id)
+            writer.done(team_id, season, digest)
+    print(f"Wrote {writer.written['Coach']} coaches ({writer.report('coaches')}) and "
+          f"{writer.written['CoachHistory']} history rows ({writer.report('coach_history')}).")
+    return changed_ids
+
+#Defining a function to run the whole stage.
+def run(seasons=None):
+    """Loads the teams and coaches for every season."""
+    for season in seasons or config.SEASONS:
+        load_season(season)
+
+if __name__ == "__main__":
+    args = build_parser("Load teams and coaches.").parse_args()
+    apply_options(args)
+    with profile_stage("teams"):
+        run(args.seasons)
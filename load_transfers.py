@@ -1,134 +1,163 @@
 import requests
-from utils.db import get_db_connection
-from utils.api import HEADERS
-import time
+from collections import namedtuple
+from utils.db import get_db_connection, bulk_merge_known, resolve_unresolved, fetch_teams_for_season, fetch_coached_teams_for_season, ensure_season_partitions
+from utils.api import client
+from utils.fetch import fetch_all
+from utils.sync import SyncTracker, NO_SEASON
+from utils.checkpoint import Checkpoint, start_checkpoint
+from utils.shard import run_sharded
+from utils.stream import StreamWriter
+from utils.profiling import profile_stage, track_allocations
+from utils.metrics import metrics
+from utils.aggregates import refresh_aggregates
+from utils.cli import build_parser, apply_options
+from utils import config
 
-LEAGUE_ID = 39
-SEASONS = [2018, 2021]
+#Row the formatter yields; the field names are the table columns.
+Transfer = namedtuple("Transfer", ["player_id", "from_team_id", "to_team_id", "transfer_fee", "season", "date"])
 
-#Defining a function to fetch known player and team IDs from the database.
-def fetch_known_ids():
-    """Fetches all known player and team IDs from the database."""
-    try:
-        with get_db_connection() as conn:
-            with conn.cursor() as cur:
-                cur.execute("SELECT player_id FROM players;")
-                player_ids = {row[0] for row in cur.fetchall()}
-                cur.execute("SELECT team_id FROM teams;")
-                team_ids = {row[0] for row in cur.fetchall()}
-        return player_ids, team_ids
-    except Exception as e:
-        print(f"Error fetching known IDs from DB: {e}")
-        return set(), set()
+#Columns that must point at a loaded player or team before a transfer can be stored.
+TRANSFER_REFERENCES = {
+    "player_id": ("players", "player_id"),
+    "from_team_id": ("teams", "team_id"),
+    "to_team_id": ("teams", "team_id"),
+}
+TRANSFER_KEY = ["player_id", "from_team_id", "to_team_id", "date", "season"]
 
 #Defining a function to get transfers for a given team.
 def get_transfers_for_team(team_id):
     """Fetches all transfers for a given team from the API."""
-    url = f"https://v3.football.api-sports.io/transfers?team={team_id}"
     try:
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
+        return client.get("transfers", team=team_id)
     except requests.exceptions.RequestException as e:
         print(f"Error fetching transfers for team {team_id}: {e}")
         return None
 
+#Defining a function to parse a transfer fee.
+def parse_fee(fee_str):
+    """Parses a fee such as "€ 12.5M" or "€ 800K" into euros, or returns None for free transfers and loans."""
+    if not fee_str or "€" not in fee_str:
+        return None
+    try:
+        fee_val = fee_str.split("€")[1].strip()
+        if 'M' in fee_val:
+            return float(fee_val.replace('M', '')) * 1000000
+        elif 'K' in fee_val:
+            return float(fee_val.replace('K', '')) * 1000
+        return float(fee_val)
+    except (ValueError, IndexError):
+        return None
+
 #Defining a function to format the transfers data.
-def format_transfers(data, season, known_player_ids, known_team_ids):
-    """Formats the transfers data and returns a list of dictionaries."""
-    transfers = []
+@track_allocations
+def format_transfers(data, seasons):
+    """Formats the transfers data in one pass, yielding a Transfer record per transfer made in any of the seasons."""
     if not data or "response" not in data:
-        return transfers
-    
+        return
+    #A transfer belongs to the season named after the year it happened in.
+    seasons = {str(season): season for season in seasons}
+
     #Looping through the transfers in the response.
     for item in data["response"]:
         player_id = item["player"]["id"]
-        if player_id not in known_player_ids:
-            continue
 
         #Looping through the transfers for the player.
         for t in item.get("transfers", []):
             transfer_date = t.get("date")
-            if not transfer_date or not transfer_date.startswith(str(season)):
+            season = seasons.get(transfer_date[:4]) if transfer_date else None
+            if season is None:
                 continue
 
             teams = t.get("teams", {})
             from_team = teams.get("out", {})
             to_team = teams.get("in", {})
 
-            from_team_id = from_team.get("id")
-            to_team_id = to_team.get("id")
-
-            if from_team_id and from_team_id not in known_team_ids:
-                continue
-            if to_team_id and to_team_id not in known_team_ids:
-                continue
-            
-            fee_str = t.get("type")
-            fee = None
-            if fee_str and "€" in fee_str:
-                try:
-                    fee_val = fee_str.split("€")[1].strip()
-                    if 'M' in fee_val:
-                        fee = float(fee_val.replace('M', '')) * 1000000
-                    elif 'K' in fee_val:
-                        fee = float(fee_val.replace('K', '')) * 1000
-                    else:
-                        fee = float(fee_val)
-                except (ValueError, IndexError):
-                    fee = None
-
-            transfers.append({
-                "player_id": player_id,
-                "from_team_id": from_team_id,
-                "to_team_id": to_team_id,
-                "transfer_fee": fee,
-                "season": season,
-                "date": transfer_date
-            })
-    return transfers
+            yield Transfer(player_id, from_team.get("id"), to_team.get("id"), parse_fee(t.get("type")), season, transfer_date)
 
 #Defining a function to insert the transfers into the database.
+@track_allocations
 def insert_transfers(transfers):
-    """Inserts a list of transfers into the database."""
+    """Inserts the transfers between known players and teams, parks the rest, and returns True on success."""
     if not transfers:
-        return
+        return True
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                #Looping through the transfers.
-                for t in transfers:
-                    cur.execute("""
-                        INSERT INTO transfers (player_id, from_team_id, to_team_id, transfer_fee, season, date)
-                        VALUES (%s, %s, %s, %s, %s, %s)
-                        ON CONFLICT (player_id, from_team_id, to_team_id, date) DO NOTHING;
-                    """, (
-                        t["player_id"],
-                        t["from_team_id"],
-                        t["to_team_id"],
-                        t["transfer_fee"],
-                        t["season"],
-                        t["date"]
-                    ))
+                bulk_merge_known(cur, "transfers", Transfer._fields, transfers, TRANSFER_KEY,
+                                 TRANSFER_REFERENCES, "transfers_unresolved")
                 conn.commit()
+                return True
     except Exception as e:
         print(f"Error inserting transfers: {e}")
+        return False
+
+#Defining a function to backfill parked transfers.
+def resolve_transfers():
+    """Moves parked transfers whose players and teams have been loaded since into the transfers table."""
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                moved = resolve_unresolved(cur, "transfers", Transfer._fields, TRANSFER_KEY,
+                                           TRANSFER_REFERENCES, "transfers_unresolved")
+                conn.commit()
+        if moved:
+            print(f"Resolved {moved} previously unresolved transfers.")
+    except Exception as e:
+        print(f"Error resolving parked transfers: {e}")
+
+#Defining a function to write one batch of streamed records.
+def write_transfers(rows):
+    """Inserts a batch of Transfer records, once each, and returns True on success."""
+    #A transfer between two loaded clubs shows up in both clubs' feeds.
+    transfers = {}
+    for t in rows.get(Transfer, []):
+        transfers.setdefault((t.player_id, t.from_team_id, t.to_team_id, t.date, t.season), t)
+    return insert_transfers(list(transfers.values()))
+
+#Defining a function to load the transfers of some teams for several seasons.
+def load_transfers(seasons, team_ids):
+    """Fetches each given team's transfer history once, loads its transfers into every season and returns the teams whose data changed."""
+    #A team is refetched if its transfers are stale for any of the seasons.
+    transfers_sync = SyncTracker("transfers")
+    checkpoint = Checkpoint("transfers")
+    todo_ids = checkpoint.todo(transfers_sync.stale(team_ids, seasons))
+    print(f"  -> Fetching transfers for {len(todo_ids)} of {len(team_ids)} teams...")
+    changed_ids = set()
+
+    #Fetching every stale, unfinished team's transfers concurrently under the shared rate limiter.
+    with StreamWriter(write_transfers, transfers_sync, checkpoint) as writer:
+        for team_id, transfers_data in fetch_all(get_transfers_for_team, todo_ids):
+            if transfers_data is None:
+                checkpoint.failed(team_id, "API request failed")
+                continue
+            changed, digest = transfers_sync.check(team_id, seasons, transfers_data)
+            if changed:
+                changed_ids.add(team_id)
+                writer.put_all(metrics.timed(format_transfers(transfers_data, seasons), "format", entity="transfers"), team_id)
+            for season in seasons:
+                writer.done(team_id, season, digest)
+    print(f"Wrote {writer.written['Transfer']} transfers: {writer.report('transfers')}.")
+    return changed_ids
+
+#Defining a function to run the whole stage.
+def run(seasons=None):
+    """Loads the transfers of every team of the configured leagues into every season, fetching each team once."""
+    seasons = list(seasons or config.SEASONS)
+    #Seasons loaded before league_teams existed only have their teams in coach_history.
+    team_ids = sorted(set().union(*(fetch_teams_for_season(season, config.LEAGUES)
+                                    or fetch_coached_teams_for_season(season) for season in seasons)))
+    if not team_ids:
+        print("No teams found in the database. Run the teams and coaches loader first.")
+        return
+    #Players and teams loaded since the last run may resolve transfers parked back then.
+    ensure_season_partitions(seasons)
+    resolve_transfers()
+    start_checkpoint("transfers", NO_SEASON)
+    changed = run_sharded(load_transfers, seasons, team_ids)
+    refresh_aggregates("transfers", seasons, set().union(*changed))
 
-#Getting the known player and team IDs from the database.
-known_player_ids, known_team_ids = fetch_known_ids()
-if not known_team_ids:
-    print("No teams found in the database. Run the teams and coaches loader first.")
-    exit()
-
-#Looping through the seasons.
-for season in SEASONS:
-    print(f"-- Processing Season: {season} --")
-    #Looping through the known teams.
-    for team_id in known_team_ids:
-        print(f"  -> Fetching transfers for team {team_id}...")
-        transfers_data = get_transfers_for_team(team_id)
-        if transfers_data:
-            transfers = format_transfers(transfers_data, season, known_player_ids, known_team_ids)
-            insert_transfers(transfers)
-            print(f"Inserted/updated {len(transfers)} transfers.")
-        time.sleep(1.5)
\ No newline at end of file
+if __name__ == "__main__":
+    args = build_parser("Load player transfers.").parse_args()
+    apply_options(args)
+    with profile_stage("transfers"):
+        run(args.seasons)
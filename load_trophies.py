@@ -1,7 +1,20 @@
+import re
 import requests
-from utils.db import get_db_connection
-from utils.api import HEADERS
-import time
+from collections import namedtuple
+from utils.db import get_db_connection, bulk_upsert
+from utils.api import client
+from utils.fetch import fetch_all
+from utils.sync import SyncTracker, NO_SEASON
+from utils.checkpoint import Checkpoint, start_checkpoint
+from utils.shard import run_sharded
+from utils.stream import StreamWriter
+from utils.profiling import profile_stage, track_allocations
+from utils.metrics import metrics
+from utils.aggregates import refresh_aggregates
+from utils.cli import build_parser, apply_options
+
+#Row the formatter yields; the field names are the table columns.
+Trophy = namedtuple("Trophy", ["player_id", "coach_id", "name", "season", "result"])
 
 #Defining a function to fetch known player and coach IDs from the database.
 def fetch_players_and_coaches():
@@ -21,101 +34,105 @@ def fetch_players_and_coaches():
 #Defining a function to get trophies for a given entity (player or coach).
 def get_trophies(entity_id, entity_type):
     """Fetches all trophies for a given entity (player or coach) from the API."""
-    url = f"https://v3.football.api-sports.io/trophies?{entity_type}={entity_id}"
     try:
-        response = requests.get(url, headers=HEADERS)
-        response.raise_for_status()
-        return response.json()
+        return client.get("trophies", **{entity_type: entity_id})
     except requests.exceptions.RequestException as e:
         print(f"Error fetching trophies for {entity_type} {entity_id}: {e}")
         return None
 
+#Defining a function to read a trophy's season.
+def parse_season(value):
+    """Returns the season's start year: 2018 for "2018", "2018/2019" or "2018 Russia", None if there is none."""
+    if isinstance(value, int):
+        return value
+    match = re.match(r"\s*(\d{4})", value or "")
+    return int(match.group(1)) if match else None
+
 #Defining a function to format the trophies data.
+@track_allocations
 def format_trophies(data, entity_id, entity_type):
-    """Formats the trophies data and returns a list of dictionaries."""
-    trophies = []
+    """Formats the trophies data, yielding a Trophy record per final won or lost."""
     if not data or not data.get("response"):
-        return trophies
+        return
 
-    #Looping through the trophies in the response.
+    #Looping through the trophies in the response; unnamed ones cannot be stored.
     for t in data["response"]:
         place = t.get("place")
-        if place in ["Winner", "Runner-up"]:
-            season_str = t.get("season")
-            season = None
-            if season_str and isinstance(season_str, str) and season_str.isdigit():
-                season = int(season_str)
-            elif isinstance(season_str, int):
-                season = season_str
-
-            trophy = {
-                "name": t.get("league"),
-                "season": season,
-                "result": "Winner" if place == "Winner" else "Finalist"
-            }
+        if place in ["Winner", "Runner-up"] and t.get("league"):
+            season = parse_season(t.get("season"))
+            result = "Winner" if place == "Winner" else "Finalist"
             if entity_type == 'player':
-                trophy['player_id'] = entity_id
-                trophy['coach_id'] = None
+                yield Trophy(entity_id, None, t["league"], season, result)
             else:
-                trophy['player_id'] = None
-                trophy['coach_id'] = entity_id
-            trophies.append(trophy)
-
-    return trophies
+                yield Trophy(None, entity_id, t["league"], season, result)
 
 #Defining a function to insert the trophies into the database.
+@track_allocations
 def insert_trophies(trophies):
-    """Inserts a list of trophies into the database."""
+    """Inserts or updates a list of trophies, keyed by owner, name and season, and returns True on success."""
     if not trophies:
-        return
+        return True
+    #One statement may only update a row once, so the last record per key wins.
+    trophies = list({(t.player_id, t.coach_id, t.name, t.season): t for t in trophies}.values())
 
     try:
         with get_db_connection() as conn:
             with conn.cursor() as cur:
-                #Looping through the trophies.
-                for trophy in trophies:
-                    if not all(k in trophy for k in ["name", "season"]):
-                        continue
-                    cur.execute("""
-                        INSERT INTO trophies (player_id, coach_id, name, season, result)
-                        VALUES (%s, %s, %s, %s, %s)
-                        ON CONFLICT (player_id, coach_id, name, season) DO NOTHING;
-                    """, (
-                        trophy["player_id"],
-                        trophy["coach_id"],
-                        trophy["name"],
-                        trophy["season"],
-                        trophy["result"]
-                    ))
+                bulk_upsert(cur, "trophies", Trophy._fields, trophies,
+                            ["player_id", "coach_id", "name", "season"], update_columns=["result"])
                 conn.commit()
+                return True
     except Exception as e:
         print(f"Error inserting trophies: {e}")
+        return False
+
+#Defining a function to write one batch of streamed records.
+def write_trophies(rows):
+    """Inserts a batch of Trophy records and returns True on success."""
+    return insert_trophies(rows.get(Trophy, []))
+
+#Defining a function to run the whole stage.
+def run():
+    """Loads the trophies of every known player and coach, skipping fresh ones."""
+    #Printing a message to indicate that the players and coaches are being fetched.
+    print("📦 Fetching players and coaches from DB...")
+    #Getting the known player and coach IDs from the database.
+    player_ids, coach_ids = fetch_players_and_coaches()
+
+    #Loading the players' and then the coaches' trophies.
+    for entity_type, entity_ids in (('player', player_ids), ('coach', coach_ids)):
+        start_checkpoint(f"trophies/{entity_type}")
+        changed = run_sharded(load_trophies, entity_type, entity_ids)
+        refresh_aggregates("trophies", owner_type=entity_type, owner_ids=set().union(*changed))
 
-#Printing a message to indicate that the players and coaches are being fetched.
-print("📦 Fetching players and coaches from DB...")
-#Getting the known player and coach IDs from the database.
-player_ids, coach_ids = fetch_players_and_coaches()
+#Defining a function to load the trophies of some players or coaches.
+def load_trophies(entity_type, entity_ids):
+    """Fetches and loads the trophies of the given players or coaches and returns the ones whose data changed."""
+    loader = f"trophies/{entity_type}"
+    trophies_sync = SyncTracker(loader)
+    checkpoint = Checkpoint(loader)
+    todo_ids = checkpoint.todo(trophies_sync.stale(entity_ids))
+    changed_ids = set()
+    if not todo_ids:
+        return changed_ids
+    print(f"📡 Fetching {entity_type} trophies for {len(todo_ids)} of {len(entity_ids)} IDs...")
 
-#Looping through the players.
-if player_ids:
-    for player_id in player_ids:
-        print(f"📡 Fetching trophies for player {player_id}...")
-        data = get_trophies(player_id, 'player')
-        if data:
-            trophies = format_trophies(data, player_id, 'player')
-            if trophies:
-                insert_trophies(trophies)
-                print(f"Inserted/updated {len(trophies)} trophies.")
-        time.sleep(1.5)
+    #Fetching the trophies concurrently under the shared rate limiter and streaming them to the writer.
+    with StreamWriter(write_trophies, trophies_sync, checkpoint) as writer:
+        for entity_id, data in fetch_all(lambda e: get_trophies(e, entity_type), todo_ids):
+            if data is None:
+                checkpoint.failed(entity_id, "API request failed")
+                continue
+            changed, digest = trophies_sync.check(entity_id, NO_SEASON, data)
+            if changed:
+                changed_ids.add(entity_id)
+                writer.put_all(metrics.timed(format_trophies(data, entity_id, entity_type), "format", entity="trophies"), entity_id)
+            writer.done(entity_id, NO_SEASON, digest)
+    print(f"Wrote {writer.written['Trophy']} {entity_type} trophies: {writer.report('trophies')}.")
+    return changed_ids
 
-#Looping through the coaches.
-if coach_ids:
-    for coach_id in coach_ids:
-        print(f"📡 Fetching trophies for coach {coach_id}...")
-        data = get_trophies(coach_id, 'coach')
-        if data:
-            trophies = format_trophies(data, coach_id, 'coach')
-            if trophies:
-                insert_trophies(trophies)
-                print(f"Inserted/updated {len(trophies)} trophies.")
-        time.sleep(1.5)
\ No newline at end of file
+if __name__ == "__main__":
+    args = build_parser("Load trophies for players and coaches.", seasonal=False).parse_args()
+    apply_options(args)
+    with profile_stage("trophies"):
+        run()
@@ -0,0 +1,82 @@
+-- Partitions player_stats and transfers by season (LIST), so each season's rows and
+-- indexes live in their own table: closed seasons stay cold and loads into the current
+-- season only touch the current partition. Databases created from schema.sql already
+-- have partitioned tables; older ones are converted here by copying into new tables.
+
+DO $$
+DECLARE
+    s INT;
+    idx TEXT;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'player_stats'::regclass) THEN
+        ALTER TABLE player_stats RENAME TO player_stats_unpartitioned;
+        FOR idx IN SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                   WHERE i.indrelid = 'player_stats_unpartitioned'::regclass LOOP
+            EXECUTE format('ALTER INDEX %I RENAME TO %I', idx, left(idx, 50) || '_unpart');
+        END LOOP;
+
+        CREATE TABLE player_stats (
+            player_id INT REFERENCES players(player_id),
+            team_id INT REFERENCES teams(team_id),
+            season INT,
+            appearances INT,
+            goals INT,
+            assists INT,
+            minutes_played INT,
+            PRIMARY KEY (player_id, team_id, season)
+        ) PARTITION BY LIST (season);
+
+        FOR s IN SELECT DISTINCT season FROM player_stats_unpartitioned LOOP
+            EXECUTE format('CREATE TABLE player_stats_%s PARTITION OF player_stats FOR VALUES IN (%s)', s, s);
+        END LOOP;
+        INSERT INTO player_stats SELECT * FROM player_stats_unpartitioned;
+        DROP TABLE player_stats_unpartitioned;
+    END IF;
+
+    IF NOT EXISTS (SELECT 1 FROM pg_partitioned_table WHERE partrelid = 'transfers'::regclass) THEN
+        ALTER TABLE transfers RENAME TO transfers_unpartitioned;
+        FOR idx IN SELECT c.relname FROM pg_index i JOIN pg_class c ON c.oid = i.indexrelid
+                   WHERE i.indrelid = 'transfers_unpartitioned'::regclass LOOP
+            EXECUTE format('ALTER INDEX %I RENAME TO %I', idx, left(idx, 50) || '_unpart');
+        END LOOP;
+        ALTER SEQUENCE transfers_transfer_id_seq RENAME TO transfers_unpartitioned_transfer_id_seq;
+
+        -- Unique keys of a partitioned table must include the partition key.
+        CREATE TABLE transfers (
+            transfer_id SERIAL,
+            player_id INT REFERENCES players(player_id),
+            from_team_id INT REFERENCES teams(team_id),
+            to_team_id INT REFERENCES teams(team_id),
+            transfer_fee NUMERIC,
+            season INT,
+            date DATE,
+            PRIMARY KEY (transfer_id, season),
+            UNIQUE (player_id, from_team_id, to_team_id, date, season)
+        ) PARTITION BY LIST (season);
+
+        FOR s IN SELECT DISTINCT season FROM transfers_unpartitioned WHERE season IS NOT NULL LOOP
+            EXECUTE format('CREATE TABLE transfers_%s PARTITION OF transfers FOR VALUES IN (%s)', s, s);
+        END LOOP;
+        INSERT INTO transfers SELECT * FROM transfers_unpartitioned WHERE season IS NOT NULL;
+        PERFORM setval('transfers_transfer_id_seq', (SELECT COALESCE(MAX(transfer_id), 0) + 1 FROM transfers), false);
+        DROP TABLE transfers_unpartitioned;
+    END IF;
+
+    -- Parked transfers are merged with the same key as transfers.
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'transfers_unresolved_key') THEN
+        FOR idx IN SELECT conname FROM pg_constraint
+                   WHERE conrelid = 'transfers_unresolved'::regclass AND contype = 'u' LOOP
+            EXECUTE format('ALTER TABLE transfers_unresolved DROP CONSTRAINT %I', idx);
+        END LOOP;
+        ALTER TABLE transfers_unresolved ADD CONSTRAINT transfers_unresolved_key
+            UNIQUE (player_id, from_team_id, to_team_id, date, season);
+    END IF;
+END $$;
+
+-- Rows for seasons without their own partition yet; ensure_season_partitions moves them out.
+CREATE TABLE IF NOT EXISTS player_stats_default PARTITION OF player_stats DEFAULT;
+CREATE TABLE IF NOT EXISTS transfers_default PARTITION OF transfers DEFAULT;
+
+-- Indexes that went with the unpartitioned tables.
+CREATE INDEX IF NOT EXISTS idx_player_stats_season ON player_stats(player_id, season);
+CREATE INDEX IF NOT EXISTS idx_transfers_player ON transfers(player_id);
@@ -0,0 +1,17 @@
+-- Indexes for the loaders' lookups and the dashboard queries; `python -m utils.migrate --check`
+-- confirms with EXPLAIN that the hot queries can use them.
+
+-- fetch_teams_for_season falls back to the teams in coach_history for a season,
+-- and team_season_profile lists a team's coaches for a season.
+CREATE INDEX IF NOT EXISTS idx_coach_history_season ON coach_history(season, team_id);
+
+-- Aggregate refreshes rebuild the stats of some teams within a season's partition.
+CREATE INDEX IF NOT EXISTS idx_player_stats_team ON player_stats(team_id, season);
+
+-- Net transfer spend is rebuilt for the clubs on either side of the changed transfers.
+CREATE INDEX IF NOT EXISTS idx_transfers_from_team ON transfers(from_team_id, season);
+CREATE INDEX IF NOT EXISTS idx_transfers_to_team ON transfers(to_team_id, season);
+
+-- Trophy counts and coach pages look trophies up by coach; the trophies key leads with
+-- player_id, so it already serves the player lookups.
+CREATE INDEX IF NOT EXISTS idx_trophies_coach ON trophies(coach_id);
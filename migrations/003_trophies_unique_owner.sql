@@ -0,0 +1,56 @@
+-- Every trophy row leaves either player_id or coach_id NULL, and NULLs are distinct in
+-- a plain UNIQUE constraint, so reruns appended a copy of every trophy. This removes
+-- the copies and replaces the key with one that treats NULLs as equal, so the
+-- loader's ON CONFLICT fires. Needs PostgreSQL 15+.
+
+-- Rows equal in every column are copies left by reruns; the oldest one is kept.
+DELETE FROM trophies
+WHERE trophy_id IN (
+    SELECT trophy_id FROM (
+        SELECT trophy_id,
+               ROW_NUMBER() OVER (PARTITION BY player_id, coach_id, name, season, result ORDER BY trophy_id) AS copy
+        FROM trophies
+        WHERE season IS NOT NULL
+    ) copies
+    WHERE copy > 1
+);
+
+-- A competition is either won or lost in a season, so rows that still share a key are
+-- one final whose result changed between loads; the latest load's row is kept.
+DELETE FROM trophies
+WHERE trophy_id IN (
+    SELECT trophy_id FROM (
+        SELECT trophy_id,
+               ROW_NUMBER() OVER (PARTITION BY player_id, coach_id, name, season ORDER BY trophy_id DESC) AS newer
+        FROM trophies
+        WHERE season IS NOT NULL
+    ) results
+    WHERE newer > 1
+);
+
+-- Earlier loaders stored "2018/2019" seasons as NULL, so those rows cannot be told apart
+-- from the same competition won in another season. They are removed together with
+-- their owners' sync state, and the next load (or --replay) writes them back with the
+-- season's start year.
+DELETE FROM sync_state
+WHERE (endpoint = 'trophies/player' AND entity_id IN (SELECT player_id FROM trophies WHERE season IS NULL AND player_id IS NOT NULL))
+   OR (endpoint = 'trophies/coach' AND entity_id IN (SELECT coach_id FROM trophies WHERE season IS NULL AND coach_id IS NOT NULL));
+DELETE FROM trophies WHERE season IS NULL;
+
+DO $$
+DECLARE
+    con TEXT;
+BEGIN
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'trophies_owner_key') THEN
+        FOR con IN SELECT conname FROM pg_constraint WHERE conrelid = 'trophies'::regclass AND contype = 'u' LOOP
+            EXECUTE format('ALTER TABLE trophies DROP CONSTRAINT %I', con);
+        END LOOP;
+        ALTER TABLE trophies ADD CONSTRAINT trophies_owner_key
+            UNIQUE NULLS NOT DISTINCT (player_id, coach_id, name, season);
+    END IF;
+    IF NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conname = 'trophies_one_owner') THEN
+        ALTER TABLE trophies ADD CONSTRAINT trophies_one_owner CHECK (num_nonnulls(player_id, coach_id) = 1);
+    END IF;
+END $$;
+
+-- The reclaimed space is reused by later loads; VACUUM FULL trophies returns it to the OS if needed.
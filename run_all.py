@@ -1,5 +1,35 @@
 #Importing the function to get a database connection.
-from utils.db import get_db_connection
+from utils.db import get_db_connection, pool_stats, ensure_season_partitions
+from utils.migrate import apply_migrations, pending_migrations
+from utils import config
+from utils.api import client
+from utils.cache import cache
+from utils.cli import build_parser, apply_options
+from utils.sync import sync_report
+from utils.aggregates import rebuild_aggregates
+from utils.metrics import write_reports
+from utils.profiling import profile_stage
+from utils.planner import QUOTA_SHARE, order_seasons, make_plan, print_plan
+from utils.ratelimit import QuotaExhausted
+import re
+import importlib
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+#Every stage, the module that implements it and the stages it depends on.
+#Seasonal stages expose load_season(season) and run one partition per season;
+#the others expose run() and cover every configured season themselves.
+STAGES = {
+    "teams": {"module": "load_teams_and_coaches", "deps": [], "seasonal": True},
+    "players": {"module": "load_players_and_stats", "deps": ["teams"], "seasonal": True},
+    "transfers": {"module": "load_transfers", "deps": ["teams", "players"], "seasonal": False},
+    "trophies": {"module": "load_trophies", "deps": ["teams", "players"], "seasonal": False},
+    "export": {"module": "export_datasets", "deps": ["teams", "players", "transfers", "trophies"], "seasonal": False},
+}
+
+#Default number of stage partitions allowed to run at the same time.
+STAGE_WORKERS = 4
 
 def create_schema():
     """Creates the database schema by executing the schema.sql file."""
@@ -7,25 +37,199 @@ def create_schema():
     try:
         with open('schema.sql', 'r') as f:
             sql = f.read()
-        
+
         with get_db_connection() as conn:
             with conn.cursor() as cur:
                 cur.execute(sql)
                 conn.commit()
+        apply_migrations()
+        ensure_season_partitions(config.SEASONS)
         print("Schema created successfully.")
     except Exception as e:
         print(f"An error occurred during schema creation: {e}")
         exit(1)
 
+#Defining a function to find what create_schema would still change.
+def schema_changes():
+    """Returns the tables in schema.sql missing from the database and the pending migrations, changing nothing."""
+    with open('schema.sql', 'r') as f:
+        tables = re.findall(r"CREATE TABLE IF NOT EXISTS (\w+)", f.read())
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT name FROM unnest(%s::text[]) AS name WHERE to_regclass(name) IS NULL;", (tables,))
+            missing = [row[0] for row in cur.fetchall()]
+    return missing, pending_migrations()
+
+#Defining a function to work out which stages a run covers.
+def select_stages(only=None, start=None):
+    """Returns the selected stage names in dependency order."""
+    order = list(STAGES)
+    if only:
+        unknown = set(only) - set(order)
+        if unknown:
+            raise ValueError(f"Unknown stage(s): {', '.join(sorted(unknown))}")
+        return [name for name in order if name in only]
+    if start:
+        if start not in STAGES:
+            raise ValueError(f"Unknown stage: {start}")
+        #Everything downstream of the starting stage is rerun too.
+        selected = {start}
+        for name in order:
+            if set(STAGES[name]["deps"]) & selected:
+                selected.add(name)
+        return [name for name in order if name in selected]
+    return order
+
+#Defining a function to list the partitions a partition builds on.
+def upstream(name, season, stages):
+    """Returns the (stage, season) partitions of the selected stages that the partition's season depends on."""
+    if season is None:
+        #Stages covering every season work with whatever their dependencies managed to load.
+        return set()
+    return {(dep, season) for dep in STAGES[name]["deps"] if dep in stages and STAGES[dep]["seasonal"]}
+
+#Defining a function to list the partitions of a run in the order they start.
+def partitions(stages, seasons):
+    """Returns (stage, season, upstream) for every partition, in dependency and season priority order."""
+    return [(name, season, upstream(name, season, stages))
+            for name in stages for season in (seasons if STAGES[name]["seasonal"] else [None])]
+
+#Defining a function to run the selected stages as a dependency graph.
+def run_stages(stages, seasons, workers=STAGE_WORKERS, plan=None):
+    """Runs independent stages and per-season partitions in parallel and returns their timeline.
+
+    With a QuotaPlan, a partition only starts if its estimated API calls fit the budget;
+    otherwise it is skipped, together with the partitions of its season that build on it.
+    """
+    timeline = []
+    timeline_lock = threading.Lock()
+    run_start = time.monotonic()
+    skipped = set()
+
+    def run_task(name, season):
+        module = importlib.import_module(STAGES[name]["module"])
+        start = time.monotonic()
+        try:
+            with profile_stage(name if season is None else f"{name}[{season}]"):
+                if season is None:
+                    module.run()
+                else:
+                    module.load_season(season)
+        finally:
+            if plan is not None:
+                plan.release(name, season)
+            with timeline_lock:
+                timeline.append((name, season, start - run_start, time.monotonic() - run_start))
+
+    def finish(name):
+        remaining[name] -= 1
+        if remaining[name] == 0:
+            for deps in pending.values():
+                deps.discard(name)
+
+    #Dependencies outside the selection are assumed to be loaded already.
+    pending = {name: set(STAGES[name]["deps"]) & set(stages) for name in stages}
+    remaining = {}
+    running = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while pending or running:
+            ready = [n for n, deps in pending.items() if not deps]
+            for name in ready:
+                del pending[name]
+                seasons_of_stage = seasons if STAGES[name]["seasonal"] else [None]
+                remaining[name] = len(seasons_of_stage)
+                for season in seasons_of_stage:
+                    if upstream(name, season, stages) & skipped or (plan is not None and not plan.admit(name, season)):
+                        skipped.add((name, season))
+                        finish(name)
+                        continue
+                    running[executor.submit(run_task, name, season)] = name
+            if ready and not running:
+                #Everything ready was skipped, so the stages waiting on it can be looked at now.
+                continue
+            if not running:
+                if pending:
+                    raise RuntimeError(f"Stage dependency cycle: {', '.join(pending)}")
+                break
+
+            done, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in done:
+                name = running.pop(future)
+                #A failed partition stops the pipeline before any dependent stage starts.
+                future.result()
+                finish(name)
+    return timeline
+
+#Defining a function to print the per-stage wall-clock timeline.
+def print_timeline(timeline, width=40):
+    """Prints when each stage partition started and finished, with a bar chart."""
+    if not timeline:
+        return
+    total = max(end for _, _, _, end in timeline) or 1
+    print("\nStage timeline:")
+    for name, season, start, end in sorted(timeline, key=lambda t: t[2]):
+        label = name if season is None else f"{name}[{season}]"
+        bar_start = int(start / total * width)
+        bar_len = max(1, int((end - start) / total * width))
+        bar = " " * bar_start + "#" * bar_len
+        print(f"  {label:<18} {start:8.1f}s -> {end:8.1f}s  |{bar:<{width}}|")
+
 if __name__ == "__main__":
+    parser = build_parser("Run the football data loading pipeline.")
+    parser.add_argument("--only", type=lambda s: s.split(","), help="comma-separated stages to run: " + ",".join(STAGES))
+    parser.add_argument("--from", dest="start", choices=list(STAGES), help="run this stage and everything downstream of it")
+    parser.add_argument("--workers", type=int, default=STAGE_WORKERS, help="stage partitions run at the same time")
+    parser.add_argument("--rebuild-aggregates", action="store_true", help="rebuild every dashboard aggregate before loading")
+    parser.add_argument("--dry-run", action="store_true", help="print the estimated API calls per stage and exit")
+    parser.add_argument("--quota-share", type=float, default=QUOTA_SHARE, help="share of the remaining daily quota this run may use")
+    args = parser.parse_args()
+    apply_options(args)
+    try:
+        stages = select_stages(args.only, args.start)
+    except ValueError as e:
+        parser.error(str(e))
+
+    #The current season is loaded first, so a tight quota is spent where the data changes.
+    seasons = order_seasons(args.seasons)
+
+    #A dry run only reads: it is refused rather than creating tables or migrating the data it estimates from.
+    if args.dry_run:
+        missing, pending = schema_changes()
+        if missing or pending:
+            print("The database schema is not up to date, so the estimate would be wrong; run without --dry-run once to apply:")
+            for change in [f"create table {t}" for t in missing] + [f"migration {m}" for m in pending]:
+                print(f"  {change}")
+            exit(1)
+        print_plan(partitions(stages, seasons), args.quota_share)
+        exit(0)
+
     #Create the database schema before running the data loaders.
     create_schema()
+    if args.rebuild_aggregates:
+        rebuild_aggregates()
 
-    #Import the data loading scripts to execute them.
-    print("Starting data loading scripts...")
-    import load_teams_and_coaches
-    import load_players_and_stats
-    import load_transfers
-    import load_trophies
+    #Run the data loading stages in dependency order, within this run's share of the quota.
+    plan = make_plan(args.quota_share)
+    print("Starting data loading stages...")
+    try:
+        timeline = run_stages(stages, seasons, args.workers, plan)
+    except QuotaExhausted as e:
+        print(f"\n⛔ {e} Progress has been checkpointed; rerun with --resume once the quota resets.")
+        exit(2)
+    print_timeline(timeline)
+    for line in plan.summary():
+        print(line)
 
     print("\nAll scripts completed successfully!")
+    print(f"Connection pool: {pool_stats()}")
+    print("API latency per endpoint:")
+    for line in client.latency_report():
+        print(f"  {line}")
+    if cache is not None:
+        print(f"API response cache: {cache.stats}")
+    print("API calls per endpoint:")
+    for line in sync_report():
+        print(f"  {line}")
+    reports = write_reports()
+    if reports:
+        print(f"Metrics written to {' and '.join(reports)}")
@@ -30,7 +30,16 @@ CREATE TABLE IF NOT EXISTS coach_history (
     PRIMARY KEY (coach_id, team_id, season)
 );
 
--- Player statistics for a specific team and season
+-- Which teams played in which league in a given season
+CREATE TABLE IF NOT EXISTS league_teams (
+    league_id INT,
+    season INT,
+    team_id INT REFERENCES teams(team_id),
+    PRIMARY KEY (league_id, season, team_id)
+);
+
+-- Player statistics for a specific team and season, partitioned by season
+-- (the partitions are created by migrations/ and ensure_season_partitions)
 CREATE TABLE IF NOT EXISTS player_stats (
     player_id INT REFERENCES players(player_id),
     team_id INT REFERENCES teams(team_id),
@@ -40,9 +49,10 @@ CREATE TABLE IF NOT EXISTS player_stats (
     assists INT,
     minutes_played INT,
     PRIMARY KEY (player_id, team_id, season)
-);
+) PARTITION BY LIST (season);
 
--- Trophies won by players or coaches
+-- Trophies won by players or coaches; exactly one of player_id and coach_id is set,
+-- so the owner key treats NULLs as equal (PostgreSQL 15+)
 CREATE TABLE IF NOT EXISTS trophies (
     trophy_id SERIAL PRIMARY KEY,
     player_id INT REFERENCES players(player_id),
@@ -50,24 +60,116 @@ CREATE TABLE IF NOT EXISTS trophies (
     name TEXT NOT NULL,
     season INT,
     result TEXT,
-    UNIQUE (player_id, coach_id, name, season)
+    CONSTRAINT trophies_owner_key UNIQUE NULLS NOT DISTINCT (player_id, coach_id, name, season),
+    CONSTRAINT trophies_one_owner CHECK (num_nonnulls(player_id, coach_id) = 1)
 );
 
--- Player transfers
+-- Player transfers, partitioned by season like player_stats
 CREATE TABLE IF NOT EXISTS transfers (
-    transfer_id SERIAL PRIMARY KEY,
+    transfer_id SERIAL,
     player_id INT REFERENCES players(player_id),
     from_team_id INT REFERENCES teams(team_id),
     to_team_id INT REFERENCES teams(team_id),
     transfer_fee NUMERIC,
     season INT,
     date DATE,
-    UNIQUE (player_id, from_team_id, to_team_id, date)
+    PRIMARY KEY (transfer_id, season),
+    UNIQUE (player_id, from_team_id, to_team_id, date, season)
+) PARTITION BY LIST (season);
+
+-- Transfers whose player or teams were not in the database yet; moved into transfers once they are
+CREATE TABLE IF NOT EXISTS transfers_unresolved (
+    player_id INT,
+    from_team_id INT,
+    to_team_id INT,
+    transfer_fee NUMERIC,
+    season INT,
+    date DATE,
+    first_seen TIMESTAMPTZ NOT NULL DEFAULT now(),
+    CONSTRAINT transfers_unresolved_key UNIQUE (player_id, from_team_id, to_team_id, date, season)
 );
 
--- Indexes for faster lookups
+-- Indexes for faster lookups (the workload-driven ones are in migrations/)
 CREATE INDEX IF NOT EXISTS idx_player_name ON players(name);
 CREATE INDEX IF NOT EXISTS idx_team_name ON teams(name);
 CREATE INDEX IF NOT EXISTS idx_coach_name ON coaches(name);
 CREATE INDEX IF NOT EXISTS idx_player_stats_season ON player_stats(player_id, season);
-CREATE INDEX IF NOT EXISTS idx_transfers_player ON transfers(player_id);
\ No newline at end of file
+CREATE INDEX IF NOT EXISTS idx_transfers_player ON transfers(player_id);
+
+-- When each API entity was last fetched successfully, and a hash of what came back
+-- (season is 0 for requests that are not tied to a season, e.g. trophies)
+CREATE TABLE IF NOT EXISTS sync_state (
+    endpoint TEXT NOT NULL,
+    entity_id INT NOT NULL,
+    season INT NOT NULL,
+    fetched_at TIMESTAMPTZ NOT NULL,
+    content_hash TEXT NOT NULL,
+    PRIMARY KEY (endpoint, entity_id, season)
+);
+
+-- Work units each loader has finished or failed, so an interrupted run can resume
+CREATE TABLE IF NOT EXISTS loader_checkpoints (
+    loader TEXT NOT NULL,
+    season INT NOT NULL,
+    unit_id INT NOT NULL,
+    status TEXT NOT NULL,
+    attempts INT NOT NULL DEFAULT 0,
+    last_error TEXT,
+    updated_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (loader, season, unit_id)
+);
+
+-- Dashboard aggregates, refreshed by the loaders for the seasons, teams and owners they write
+
+-- Goals, assists and minutes per team and season
+CREATE TABLE IF NOT EXISTS team_season_summary (
+    team_id INT NOT NULL,
+    season INT NOT NULL,
+    players INT NOT NULL,
+    appearances INT NOT NULL,
+    goals INT NOT NULL,
+    assists INT NOT NULL,
+    minutes_played INT NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (team_id, season)
+);
+
+-- Top scorers ('goals') and assisters ('assists') per season
+CREATE TABLE IF NOT EXISTS season_leaderboards (
+    season INT NOT NULL,
+    category TEXT NOT NULL,
+    rank INT NOT NULL,
+    player_id INT NOT NULL,
+    team_id INT,
+    value INT NOT NULL,
+    PRIMARY KEY (season, category, rank)
+);
+
+-- Money spent on and received for transfers per team and season
+CREATE TABLE IF NOT EXISTS team_transfer_spend (
+    team_id INT NOT NULL,
+    season INT NOT NULL,
+    spent NUMERIC NOT NULL,
+    received NUMERIC NOT NULL,
+    net_spend NUMERIC NOT NULL,
+    transfers_in INT NOT NULL,
+    transfers_out INT NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (team_id, season)
+);
+
+-- Titles won and finals lost per player ('player') or coach ('coach')
+CREATE TABLE IF NOT EXISTS trophy_counts (
+    owner_type TEXT NOT NULL,
+    owner_id INT NOT NULL,
+    winners INT NOT NULL,
+    finalists INT NOT NULL,
+    refreshed_at TIMESTAMPTZ NOT NULL,
+    PRIMARY KEY (owner_type, owner_id)
+);
+
+-- Files from migrations/ that have been applied to this database
+CREATE TABLE IF NOT EXISTS schema_migrations (
+    name TEXT PRIMARY KEY,
+    applied_at TIMESTAMPTZ NOT NULL DEFAULT now()
+);
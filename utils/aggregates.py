@@ -0,0 +1,148 @@
+import os
+import time
+from dotenv import load_dotenv
+from utils.db import get_db_connection
+from utils.queries import notify_changed
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Players kept per season in each leaderboard.
+LEADERBOARD_SIZE = int(os.getenv("LEADERBOARD_SIZE", "50"))
+
+#Each refresh deletes and rebuilds only the affected rows inside one transaction,
+#so dashboard reads keep seeing the previous rows until it commits and never wait on it.
+
+#Defining a function to refresh the per-team season summaries.
+def refresh_team_season_summary(cur, season, team_ids):
+    """Rebuilds the goals, assists and minutes totals of the given teams in a season."""
+    cur.execute("DELETE FROM team_season_summary WHERE season = %s AND team_id = ANY(%s);", (season, team_ids))
+    cur.execute("""
+        INSERT INTO team_season_summary (team_id, season, players, appearances, goals, assists, minutes_played, refreshed_at)
+        SELECT team_id, season, COUNT(*), COALESCE(SUM(appearances), 0), COALESCE(SUM(goals), 0),
+               COALESCE(SUM(assists), 0), COALESCE(SUM(minutes_played), 0), now()
+        FROM player_stats
+        WHERE season = %s AND team_id = ANY(%s)
+        GROUP BY team_id, season;
+    """, (season, team_ids))
+
+#Defining a function to refresh the scorer and assister leaderboards.
+def refresh_leaderboards(cur, season):
+    """Rebuilds a season's top scorers and assisters; players who moved mid-season are counted once."""
+    cur.execute("DELETE FROM season_leaderboards WHERE season = %s;", (season,))
+    cur.execute("""
+        INSERT INTO season_leaderboards (season, category, rank, player_id, team_id, value)
+        SELECT season, category, rank, player_id, team_id, value
+        FROM (
+            SELECT p.season, v.category, p.player_id, p.team_id, v.value,
+                   ROW_NUMBER() OVER (PARTITION BY v.category ORDER BY v.value DESC, p.player_id) AS rank
+            FROM (
+                SELECT season, player_id, SUM(goals) AS goals, SUM(assists) AS assists,
+                       (ARRAY_AGG(team_id ORDER BY minutes_played DESC NULLS LAST))[1] AS team_id
+                FROM player_stats
+                WHERE season = %s
+                GROUP BY season, player_id
+            ) p
+            CROSS JOIN LATERAL (VALUES ('goals', p.goals), ('assists', p.assists)) AS v(category, value)
+            WHERE v.value IS NOT NULL
+        ) ranked
+        WHERE rank <= %s;
+    """, (season, LEADERBOARD_SIZE))
+
+#Defining a function to refresh the net transfer spend.
+def refresh_transfer_spend(cur, seasons, team_ids):
+    """Rebuilds the transfer spend of the given teams, and of their counterparties, in the given seasons."""
+    #A transfer changes the spend of both clubs involved.
+    cur.execute("""
+        SELECT DISTINCT season, team_id
+        FROM transfers, LATERAL (VALUES (from_team_id), (to_team_id)) AS t(team_id)
+        WHERE season = ANY(%s) AND (from_team_id = ANY(%s) OR to_team_id = ANY(%s)) AND team_id IS NOT NULL;
+    """, (seasons, team_ids, team_ids))
+    affected = cur.fetchall() + [(season, team_id) for season in seasons for team_id in team_ids]
+    affected_seasons = [season for season, _ in affected]
+    affected_teams = [team_id for _, team_id in affected]
+    cur.execute("""
+        DELETE FROM team_transfer_spend s
+        USING unnest(%s::int[], %s::int[]) AS a(season, team_id)
+        WHERE s.season = a.season AND s.team_id = a.team_id;
+    """, (affected_seasons, affected_teams))
+    cur.execute("""
+        INSERT INTO team_transfer_spend (team_id, season, spent, received, net_spend, transfers_in, transfers_out, refreshed_at)
+        SELECT m.team_id, m.season,
+               COALESCE(SUM(m.fee) FILTER (WHERE m.incoming), 0),
+               COALESCE(SUM(m.fee) FILTER (WHERE NOT m.incoming), 0),
+               COALESCE(SUM(m.fee) FILTER (WHERE m.incoming), 0) - COALESCE(SUM(m.fee) FILTER (WHERE NOT m.incoming), 0),
+               COUNT(*) FILTER (WHERE m.incoming), COUNT(*) FILTER (WHERE NOT m.incoming), now()
+        FROM (
+            SELECT to_team_id AS team_id, season, transfer_fee AS fee, TRUE AS incoming FROM transfers
+            UNION ALL
+            SELECT from_team_id, season, transfer_fee, FALSE FROM transfers
+        ) m
+        JOIN (SELECT DISTINCT * FROM unnest(%s::int[], %s::int[]) AS a(season, team_id)) a
+          ON a.season = m.season AND a.team_id = m.team_id
+        GROUP BY m.team_id, m.season;
+    """, (affected_seasons, affected_teams))
+
+#Defining a function to refresh the trophy counts.
+def refresh_trophy_counts(cur, owner_type, owner_ids):
+    """Rebuilds the titles won and finals lost of the given players or coaches."""
+    owner_column = "player_id" if owner_type == "player" else "coach_id"
+    cur.execute("DELETE FROM trophy_counts WHERE owner_type = %s AND owner_id = ANY(%s);", (owner_type, owner_ids))
+    cur.execute(f"""
+        INSERT INTO trophy_counts (owner_type, owner_id, winners, finalists, refreshed_at)
+        SELECT %s, {owner_column}, COUNT(*) FILTER (WHERE result = 'Winner'),
+               COUNT(*) FILTER (WHERE result = 'Finalist'), now()
+        FROM trophies
+        WHERE {owner_column} = ANY(%s)
+        GROUP BY {owner_column};
+    """, (owner_type, owner_ids))
+
+#Defining a function to refresh the aggregates a load stage has changed.
+def refresh_aggregates(stage, seasons=(), team_ids=(), owner_type=None, owner_ids=()):
+    """Refreshes the summary tables fed by a stage, limited to the seasons, teams or owners it wrote."""
+    team_ids, owner_ids, seasons = list(team_ids), list(owner_ids), list(seasons)
+    if not team_ids and not owner_ids:
+        return
+    start = time.perf_counter()
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                if stage == "players":
+                    for season in seasons:
+                        refresh_team_season_summary(cur, season, team_ids)
+                        refresh_leaderboards(cur, season)
+                elif stage == "transfers":
+                    refresh_transfer_spend(cur, seasons, team_ids)
+                elif stage == "trophies":
+                    refresh_trophy_counts(cur, owner_type, owner_ids)
+                #Cached dashboard results built from these rows are dropped once the refresh commits.
+                notify_changed(cur, [f"season:{s}" for s in seasons] + [f"team:{t}" for t in team_ids]
+                               + [f"{owner_type}:{o}" for o in owner_ids])
+                conn.commit()
+        scope = f"{len(owner_ids)} {owner_type} owners" if stage == "trophies" else f"{len(team_ids)} teams in {seasons}"
+        print(f"    [aggregates] refreshed {stage} summaries for {scope} in {time.perf_counter() - start:.2f}s")
+    except Exception as e:
+        print(f"Error refreshing {stage} aggregates: {e}")
+
+#Defining a function to rebuild every aggregate from the loaded data.
+def rebuild_aggregates():
+    """Rebuilds all summary tables, e.g. after they were added to an already loaded database."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT season, ARRAY_AGG(DISTINCT team_id) FROM player_stats GROUP BY season;")
+            player_seasons = cur.fetchall()
+            cur.execute("""
+                SELECT season, ARRAY_AGG(DISTINCT team_id)
+                FROM transfers, LATERAL (VALUES (from_team_id), (to_team_id)) AS t(team_id)
+                WHERE team_id IS NOT NULL
+                GROUP BY season;
+            """)
+            transfer_seasons = cur.fetchall()
+            cur.execute("SELECT ARRAY_AGG(DISTINCT player_id), ARRAY_AGG(DISTINCT coach_id) FROM trophies;")
+            player_ids, coach_ids = cur.fetchone()
+    for season, team_ids in player_seasons:
+        refresh_aggregates("players", [season], team_ids)
+    for season, team_ids in transfer_seasons:
+        refresh_aggregates("transfers", [season], team_ids)
+    refresh_aggregates("trophies", owner_type="player", owner_ids=[p for p in player_ids or [] if p is not None])
+    refresh_aggregates("trophies", owner_type="coach", owner_ids=[c for c in coach_ids or [] if c is not None])
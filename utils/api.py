@@ -1,5 +1,17 @@
 import os
+import time
+import random
+import threading
+from collections import defaultdict
+import requests
+from requests.adapters import HTTPAdapter
 from dotenv import load_dotenv
+from utils.ratelimit import limiter, QuotaExhausted
+from utils.fetch import API_CONCURRENCY
+from utils.cache import cache
+from utils import archive as response_archive
+from utils import sync
+from utils.metrics import metrics
 
 #Load environment variables from .env file.
 load_dotenv()
@@ -14,4 +26,133 @@ if not API_KEY:
 #Define the headers for the API requests.
 HEADERS = {
     "x-apisports-key": API_KEY
-}
\ No newline at end of file
+}
+
+#Where the API lives and how patiently we talk to it.
+API_BASE_URL = os.getenv("API_BASE_URL", "https://v3.football.api-sports.io")
+API_TIMEOUT = float(os.getenv("API_TIMEOUT", "30"))
+API_MAX_RETRIES = int(os.getenv("API_MAX_RETRIES", "5"))
+API_BACKOFF_CAP = float(os.getenv("API_BACKOFF_CAP", "60"))
+
+#Status codes worth retrying: rate limited or a server-side hiccup.
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+class LatencyHistogram:
+    """Counts request latencies into fixed millisecond buckets."""
+
+    BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, float("inf"))
+
+    def __init__(self):
+        self.counts = [0] * len(self.BUCKETS_MS)
+        self.total = 0
+        self.sum_ms = 0.0
+
+    def observe(self, ms):
+        for i, bound in enumerate(self.BUCKETS_MS):
+            if ms <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum_ms += ms
+
+    def summary(self):
+        """Returns a one-line text summary of the histogram."""
+        avg = self.sum_ms / self.total if self.total else 0.0
+        buckets = " ".join(
+            f"<={'inf' if b == float('inf') else int(b)}:{c}" for b, c in zip(self.BUCKETS_MS, self.counts) if c
+        )
+        return f"n={self.total} avg={avg:.0f}ms {buckets}"
+
+class APIClient:
+    """A keep-alive, gzip-enabled API-Football client with timeouts and retry/backoff."""
+
+    def __init__(self, base_url=API_BASE_URL, headers=HEADERS, timeout=API_TIMEOUT, max_retries=API_MAX_RETRIES):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.session = requests.Session()
+        self.session.headers.update(headers)
+        self.session.headers["Accept-Encoding"] = "gzip"
+        #One pooled keep-alive connection per request we keep in flight.
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=API_CONCURRENCY)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        #Caps requests in flight across every stage sharing this client.
+        self.inflight = threading.BoundedSemaphore(API_CONCURRENCY)
+        self.latencies = defaultdict(LatencyHistogram)
+        self.lock = threading.Lock()
+
+    def _backoff(self, attempt):
+        """Returns an exponential backoff delay with full jitter."""
+        return random.uniform(0, min(API_BACKOFF_CAP, 2 ** attempt))
+
+    def get(self, endpoint, **params):
+        """Returns the decoded JSON for an endpoint and query parameters, from the cache when fresh (and not a full refresh)."""
+        if response_archive.REPLAY:
+            return response_archive.archive.replay(endpoint, params)
+        if cache is None:
+            return self._fetch(endpoint, params)
+        #A full refresh must reach the API, so it replaces cached responses rather than reading them.
+        return cache.fetch(endpoint, params, lambda: self._fetch(endpoint, params), refresh=sync.FULL_REFRESH)
+
+    def _fetch(self, endpoint, params):
+        """Fetches an endpoint from the API, retrying with backoff, and returns the decoded JSON."""
+        url = f"{self.base_url}/{endpoint}"
+        for attempt in range(self.max_retries + 1):
+            last_try = attempt == self.max_retries
+            limiter.acquire()
+            start = time.perf_counter()
+            try:
+                with self.inflight, metrics.span("api_request", endpoint=endpoint):
+                    response = self.session.get(url, params=params, timeout=self.timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                metrics.inc("api_requests", endpoint=endpoint, status="error")
+                if last_try:
+                    raise
+                metrics.inc("api_retries", endpoint=endpoint, reason=type(e).__name__)
+                time.sleep(self._backoff(attempt))
+                continue
+            with self.lock:
+                self.latencies[endpoint].observe((time.perf_counter() - start) * 1000)
+            limiter.update_from_headers(response.headers)
+            metrics.inc("api_requests", endpoint=endpoint, status=str(response.status_code))
+            #Content-Length is the compressed size that crossed the network.
+            size = response.headers.get("Content-Length")
+            metrics.inc("api_response_bytes", int(size) if size and size.isdigit() else len(response.content), endpoint=endpoint)
+            if response.status_code == 429:
+                metrics.inc("api_rate_limited", endpoint=endpoint)
+
+            if response.status_code in RETRY_STATUSES and not last_try:
+                metrics.inc("api_retries", endpoint=endpoint, reason=f"status_{response.status_code}")
+                time.sleep(self._backoff(attempt))
+                continue
+            response.raise_for_status()
+
+            data = response.json()
+            #API-Football reports quota problems in the body of a 200 response.
+            errors = data.get("errors") if isinstance(data, dict) else None
+            if isinstance(errors, dict) and "requests" in errors:
+                raise QuotaExhausted(errors["requests"])
+            if isinstance(errors, dict) and "rateLimit" in errors:
+                metrics.inc("api_rate_limited", endpoint=endpoint)
+            if isinstance(errors, dict) and "rateLimit" in errors and not last_try:
+                metrics.inc("api_retries", endpoint=endpoint, reason="rate_limit")
+                limiter.bucket.hold(self._backoff(attempt + 1))
+                continue
+            if response_archive.API_ARCHIVE_ENABLED and not errors:
+                response_archive.archive.append(endpoint, params, data)
+            return data
+
+    def status(self):
+        """Returns the account status, including today's request count; API-Football does not count this call."""
+        response = self.session.get(f"{self.base_url}/status", timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def latency_report(self):
+        """Returns one summary line per endpoint."""
+        with self.lock:
+            return [f"/{endpoint}: {hist.summary()}" for endpoint, hist in sorted(self.latencies.items())]
+
+#The client shared by every loader in this process.
+client = APIClient()
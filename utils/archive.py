@@ -0,0 +1,102 @@
+import os
+import gzip
+import json
+import glob
+import atexit
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+from dotenv import load_dotenv
+from utils.cache import normalize_url
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Where raw API responses are archived and whether archiving is on.
+API_ARCHIVE_ENABLED = os.getenv("API_ARCHIVE", "1") != "0"
+API_ARCHIVE_DIR = os.getenv("API_ARCHIVE_DIR", "archive")
+
+#Set by --replay to serve every request from the archive instead of the API.
+REPLAY = False
+
+#Records written between flushes, and partitions kept in memory while replaying.
+FLUSH_EVERY = 50
+REPLAY_PARTITIONS = 4
+
+#Defining a function to find the directory a request is archived under.
+def partition_dir(endpoint, params, root=API_ARCHIVE_DIR):
+    """Returns archive/<endpoint>/season=<season or all>."""
+    return os.path.join(root, endpoint, f"season={params.get('season', 'all')}")
+
+class ResponseArchive:
+    """An append-only, gzip-compressed JSONL store of raw API responses, partitioned by endpoint and season."""
+
+    def __init__(self, root=API_ARCHIVE_DIR):
+        self.root = root
+        self.files = {}
+        self.unflushed = {}
+        self.partitions = OrderedDict()
+        self.lock = threading.Lock()
+        atexit.register(self.close)
+
+    def append(self, endpoint, params, data):
+        """Archives one raw response."""
+        record = {
+            "endpoint": endpoint,
+            "params": params,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+            "response": data,
+        }
+        line = (json.dumps(record, separators=(",", ":")) + "\n").encode()
+        directory = partition_dir(endpoint, params, self.root)
+        with self.lock:
+            f = self.files.get(directory)
+            if f is None:
+                os.makedirs(directory, exist_ok=True)
+                #Every process writes its own part file, so archives are never rewritten.
+                name = f"part-{datetime.now(timezone.utc):%Y%m%dT%H%M%S}-{os.getpid()}.jsonl.gz"
+                f = self.files[directory] = gzip.open(os.path.join(directory, name), "ab")
+            f.write(line)
+            self.unflushed[directory] = self.unflushed.get(directory, 0) + 1
+            if self.unflushed[directory] >= FLUSH_EVERY:
+                f.flush()
+                self.unflushed[directory] = 0
+
+    def close(self):
+        """Closes every open part file."""
+        with self.lock:
+            for f in self.files.values():
+                f.close()
+            self.files = {}
+
+    def _load_partition(self, directory):
+        """Reads a partition into {normalized url: latest response}."""
+        responses = {}
+        for path in sorted(glob.glob(os.path.join(directory, "*.jsonl.gz"))):
+            try:
+                with gzip.open(path, "rt") as f:
+                    for line in f:
+                        record = json.loads(line)
+                        responses[normalize_url(record["endpoint"], record["params"])] = record["response"]
+            except (EOFError, json.JSONDecodeError):
+                #A run killed mid-write leaves a truncated tail; everything before it is still usable.
+                print(f"Archive file {path} is truncated; using the records before the break.")
+        return responses
+
+    def replay(self, endpoint, params):
+        """Returns the latest archived response for a request, or None if it was never archived."""
+        directory = partition_dir(endpoint, params, self.root)
+        with self.lock:
+            responses = self.partitions.get(directory)
+            if responses is None:
+                responses = self.partitions[directory] = self._load_partition(directory)
+                while len(self.partitions) > REPLAY_PARTITIONS:
+                    self.partitions.popitem(last=False)
+            self.partitions.move_to_end(directory)
+        data = responses.get(normalize_url(endpoint, params))
+        if data is None:
+            print(f"No archived response for /{normalize_url(endpoint, params)}")
+        return data
+
+#The archive shared by every loader in this process.
+archive = ResponseArchive()
@@ -0,0 +1,154 @@
+import os
+import json
+import time
+import zlib
+import sqlite3
+import hashlib
+import threading
+from concurrent.futures import Future
+from urllib.parse import urlencode
+from dotenv import load_dotenv
+from utils.metrics import metrics
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Where the cache lives, whether it is used and how large it may grow.
+API_CACHE_ENABLED = os.getenv("API_CACHE", "1") != "0"
+API_CACHE_PATH = os.getenv("API_CACHE_PATH", os.path.join(".cache", "api_cache.sqlite3"))
+API_CACHE_MAX_MB = float(os.getenv("API_CACHE_MAX_MB", "512"))
+
+#How long a cached response stays valid, per endpoint, in seconds. A response never
+#outlives the sync policy's TTL (utils/sync.py) for its endpoint, or a refetch that is
+#due would be answered from the cache.
+HOUR = 3600
+SYNC_CURRENT_TTL = float(os.getenv("SYNC_CURRENT_TTL_HOURS", "24")) * HOUR
+SYNC_SEASONLESS_TTL = float(os.getenv("SYNC_SEASONLESS_TTL_HOURS", "168")) * HOUR
+CACHE_TTLS = {
+    "teams": min(24 * HOUR, SYNC_CURRENT_TTL),
+    "coachs": min(24 * HOUR, SYNC_CURRENT_TTL),
+    "players": min(24 * HOUR, SYNC_CURRENT_TTL),
+    "transfers": min(24 * HOUR, SYNC_CURRENT_TTL),
+    "trophies": min(7 * 24 * HOUR, SYNC_SEASONLESS_TTL),
+}
+DEFAULT_TTL = min(24 * HOUR, SYNC_CURRENT_TTL)
+
+#Defining a function to build the canonical form of a request.
+def normalize_url(endpoint, params):
+    """Returns 'endpoint?a=1&b=2' with parameters sorted so equal requests match."""
+    return f"{endpoint}?{urlencode(sorted((k, str(v)) for k, v in params.items()))}"
+
+class ResponseCache:
+    """A content-addressed SQLite cache of compressed API responses with TTLs and an LRU size cap."""
+
+    def __init__(self, path=API_CACHE_PATH, max_bytes=API_CACHE_MAX_MB * 1024 * 1024):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self.max_bytes = max_bytes
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                endpoint TEXT NOT NULL,
+                url TEXT NOT NULL,
+                body BLOB NOT NULL,
+                size INTEGER NOT NULL,
+                fetched_at REAL NOT NULL,
+                accessed_at REAL NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS idx_responses_accessed ON responses(accessed_at)")
+        self.db.commit()
+        self.total_bytes = self.db.execute("SELECT COALESCE(SUM(size), 0) FROM responses").fetchone()[0]
+        self.lock = threading.Lock()
+        self.inflight = {}
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "evicted": 0}
+
+    def get(self, endpoint, params):
+        """Returns the cached response if present and within its TTL, otherwise None."""
+        url = normalize_url(endpoint, params)
+        key = hashlib.sha256(url.encode()).hexdigest()
+        ttl = CACHE_TTLS.get(endpoint, DEFAULT_TTL)
+        now = time.time()
+        with self.lock:
+            row = self.db.execute("SELECT body, fetched_at FROM responses WHERE key = ?", (key,)).fetchone()
+            if not row or now - row[1] > ttl:
+                return None
+            self.db.execute("UPDATE responses SET accessed_at = ? WHERE key = ?", (now, key))
+            self.db.commit()
+        return json.loads(zlib.decompress(row[0]))
+
+    def put(self, endpoint, params, data):
+        """Stores a response, evicting the least recently used entries past the size cap."""
+        url = normalize_url(endpoint, params)
+        key = hashlib.sha256(url.encode()).hexdigest()
+        body = zlib.compress(json.dumps(data, separators=(",", ":")).encode(), 6)
+        now = time.time()
+        with self.lock:
+            old = self.db.execute("SELECT size FROM responses WHERE key = ?", (key,)).fetchone()
+            self.db.execute(
+                "INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, endpoint, url, body, len(body), now, now)
+            )
+            self.total_bytes += len(body) - (old[0] if old else 0)
+            self._evict()
+            self.db.commit()
+
+    def _evict(self):
+        """Drops least recently used entries until the cache is back under its size cap."""
+        while self.total_bytes > self.max_bytes:
+            rows = self.db.execute(
+                "SELECT key, size FROM responses ORDER BY accessed_at LIMIT 100"
+            ).fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.db.execute("DELETE FROM responses WHERE key = ?", (key,))
+                self.total_bytes -= size
+                self.stats["evicted"] += 1
+                if self.total_bytes <= self.max_bytes:
+                    break
+
+    def fetch(self, endpoint, params, loader, refresh=False):
+        """Returns the cached response or calls loader() once, sharing the result with identical requests in flight.
+
+        With refresh, the cached response is ignored and replaced by a new one.
+        """
+        data = None if refresh else self.get(endpoint, params)
+        if data is not None:
+            self._count("hits")
+            metrics.inc("api_cache", endpoint=endpoint, result="hit")
+            return data
+
+        key = normalize_url(endpoint, params)
+        with self.lock:
+            future = self.inflight.get(key)
+            owner = future is None
+            if owner:
+                future = self.inflight[key] = Future()
+        if not owner:
+            self._count("coalesced")
+            metrics.inc("api_cache", endpoint=endpoint, result="coalesced")
+            return future.result()
+
+        self._count("misses")
+        metrics.inc("api_cache", endpoint=endpoint, result="miss")
+        try:
+            data = loader()
+            #Error payloads (rate limits, bad parameters) must be fetched again next time.
+            if isinstance(data, dict) and not data.get("errors"):
+                self.put(endpoint, params, data)
+            future.set_result(data)
+            return data
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+
+    def _count(self, key):
+        with self.lock:
+            self.stats[key] += 1
+
+#The cache shared by every loader in this process, or None when disabled.
+cache = ResponseCache() if API_CACHE_ENABLED else None
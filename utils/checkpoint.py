@@ -0,0 +1,83 @@
+import threading
+from datetime import datetime, timezone
+from utils.db import get_db_connection, bulk_upsert
+from utils.sync import NO_SEASON
+
+#Set by --resume to continue from the last run's checkpoints instead of starting over.
+RESUME = False
+
+#Defining a function to start a loader's checkpoint for a new run.
+def start_checkpoint(loader, season=NO_SEASON):
+    """Drops the previous run's progress unless resuming; call once before the work is split up."""
+    if RESUME:
+        return
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("DELETE FROM loader_checkpoints WHERE loader = %s AND season = %s;", (loader, season))
+            conn.commit()
+
+class Checkpoint:
+    """Durable record of the work units a loader has finished or failed for one season."""
+
+    def __init__(self, loader, season=NO_SEASON):
+        self.loader = loader
+        self.season = season
+        self.completed = set()
+        self.attempts = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT unit_id, status, attempts FROM loader_checkpoints
+                    WHERE loader = %s AND season = %s;
+                """, (loader, season))
+                for unit_id, status, attempts in cur.fetchall():
+                    if status == "done":
+                        self.completed.add(unit_id)
+                    self.attempts[unit_id] = attempts
+
+    def todo(self, unit_ids):
+        """Returns the units not finished yet: never attempted ones and the retry queue of failures."""
+        remaining = [u for u in unit_ids if u not in self.completed]
+        if len(remaining) < len(unit_ids):
+            retries = sum(1 for u in remaining if u in self.attempts)
+            print(f"  -> Resuming {self.loader}: {len(unit_ids) - len(remaining)} units done, "
+                  f"{retries} failed units to retry, {len(remaining) - retries} not yet attempted.")
+        return remaining
+
+    def done(self, unit_id):
+        """Marks a unit as finished once the next commit succeeds."""
+        with self.lock:
+            self.pending[unit_id] = ("done", None)
+
+    def failed(self, unit_id, error):
+        """Puts a unit on the persisted retry queue."""
+        with self.lock:
+            self.pending[unit_id] = ("failed", str(error)[:500])
+
+    def commit(self, written=True):
+        """Persists the pending units; finished units only count if their rows were written."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        now = datetime.now(timezone.utc)
+        rows = []
+        for unit_id, (status, error) in pending.items():
+            if status == "done" and not written:
+                status, error = "failed", "rows were not written"
+            self.attempts[unit_id] = self.attempts.get(unit_id, 0) + 1
+            if status == "done":
+                self.completed.add(unit_id)
+            rows.append((self.loader, self.season, unit_id, status, self.attempts[unit_id], error, now))
+        if not rows:
+            return
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    bulk_upsert(cur, "loader_checkpoints",
+                                ["loader", "season", "unit_id", "status", "attempts", "last_error", "updated_at"],
+                                rows, ["loader", "season", "unit_id"],
+                                update_columns=["status", "attempts", "last_error", "updated_at"])
+                    conn.commit()
+        except Exception as e:
+            print(f"Error saving checkpoint for {self.loader} {self.season}: {e}")
@@ -0,0 +1,30 @@
+import argparse
+from utils import config, sync, checkpoint, archive, shard, profiling
+from utils.config import int_list
+
+#Defining a function to build the argument parser shared by run_all and the loaders.
+def build_parser(description, seasonal=True):
+    """Returns a parser with the pipeline-wide options (and --leagues/--seasons for seasonal stages)."""
+    parser = argparse.ArgumentParser(description=description)
+    if seasonal:
+        parser.add_argument("--leagues", type=int_list, default=config.LEAGUES, help="comma-separated league IDs")
+        parser.add_argument("--seasons", type=int_list, default=config.SEASONS, help="comma-separated seasons")
+    parser.add_argument("--full-refresh", action="store_true", help="ignore the sync state and refetch everything")
+    parser.add_argument("--resume", action="store_true", help="continue from the last run's checkpoints and retry its failures")
+    parser.add_argument("--replay", action="store_true", help="rebuild from the raw response archive without calling the API")
+    parser.add_argument("--shard-workers", type=int, default=shard.SHARD_WORKERS, help="worker processes to split work units across")
+    parser.add_argument("--profile", action="store_true", help="profile each stage and write its CPU and allocation hot spots to profiles/")
+    return parser
+
+#Defining a function to apply the parsed options.
+def apply_options(args):
+    """Hands the pipeline-wide options to the modules that read them."""
+    if hasattr(args, "leagues"):
+        config.LEAGUES = args.leagues
+        config.SEASONS = args.seasons
+    #Replaying rebuilds everything from the archive, so nothing may be skipped as fresh.
+    sync.FULL_REFRESH = args.full_refresh or args.replay
+    checkpoint.RESUME = args.resume
+    archive.REPLAY = args.replay
+    shard.SHARD_WORKERS = args.shard_workers
+    profiling.PROFILE = args.profile
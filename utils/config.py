@@ -0,0 +1,14 @@
+import os
+from dotenv import load_dotenv
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Defining a function to parse a comma-separated list of integers.
+def int_list(value):
+    """Parses '2018,2021' into [2018, 2021]."""
+    return [int(x) for x in value.split(",") if x.strip()]
+
+#Leagues and seasons to load (39 is the Premier League); --leagues/--seasons override them.
+LEAGUES = int_list(os.getenv("LEAGUES", "39"))
+SEASONS = int_list(os.getenv("SEASONS", "2018,2021"))
@@ -1,13 +1,25 @@
 import psycopg2
 import os
+import io
+import csv
+import time
+import queue
+import atexit
+import threading
+from contextlib import contextmanager
 from dotenv import load_dotenv
+from utils.metrics import metrics
 
 #Load environment variables from .env file.
 load_dotenv()
 
-#Defining a function to get a database connection.
-def get_db_connection():
-    """Establishes and returns a connection to the PostgreSQL database."""
+#Pool size and how long a connection may sit idle before it is health checked.
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "4"))
+DB_HEALTHCHECK_SECONDS = float(os.getenv("DB_HEALTHCHECK_SECONDS", "30"))
+
+#Defining a function to open a new raw database connection.
+def _connect():
+    """Establishes and returns a new connection to the PostgreSQL database."""
     #Get the database connection URL from the environment variables.
     db_url = os.getenv("NEON_DB_URL")
     
@@ -16,4 +28,317 @@ def get_db_connection():
         raise ValueError("NEON_DB_URL not found. Please add it to your .env file.")
     
     #Connect to the database and return the connection object.
-    return psycopg2.connect(db_url)
\ No newline at end of file
+    return psycopg2.connect(db_url)
+
+class ConnectionPool:
+    """A process-wide pool of long-lived connections with health checks and usage stats."""
+
+    def __init__(self, size=DB_POOL_SIZE, healthcheck_seconds=DB_HEALTHCHECK_SECONDS):
+        self.size = size
+        self.healthcheck_seconds = healthcheck_seconds
+        self._idle = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(size)
+        self._lock = threading.Lock()
+        self.stats = {"checkouts": 0, "waits": 0, "connects": 0, "reconnects": 0}
+
+    def _count(self, key):
+        with self._lock:
+            self.stats[key] += 1
+
+    def _checkout(self):
+        """Takes an idle connection (checking it if it has been idle a while) or opens a new one."""
+        try:
+            conn, last_used = self._idle.get_nowait()
+        except queue.Empty:
+            self._count("connects")
+            return _connect()
+        if conn.closed:
+            self._count("reconnects")
+            return _connect()
+        if time.monotonic() - last_used > self.healthcheck_seconds:
+            try:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1;")
+                conn.rollback()
+            except psycopg2.Error:
+                conn.close()
+                self._count("reconnects")
+                return _connect()
+        return conn
+
+    @contextmanager
+    def connection(self):
+        """Checks out a connection, commits or rolls back on exit and returns it to the pool."""
+        if not self._slots.acquire(blocking=False):
+            self._count("waits")
+            self._slots.acquire()
+        self._count("checkouts")
+        conn = None
+        try:
+            conn = self._checkout()
+            try:
+                yield conn
+                if not conn.closed:
+                    conn.commit()
+            except Exception:
+                if not conn.closed:
+                    conn.rollback()
+                raise
+        finally:
+            if conn is not None and not conn.closed:
+                self._idle.put((conn, time.monotonic()))
+            self._slots.release()
+
+    def close(self):
+        """Closes every idle connection in the pool."""
+        while True:
+            try:
+                conn, _ = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            conn.close()
+
+_pool = None
+_pool_pid = None
+_pool_lock = threading.Lock()
+
+#Defining a function to get the process-wide connection pool.
+def get_pool():
+    """Returns the connection pool for this process, creating it on first use."""
+    global _pool, _pool_pid
+    with _pool_lock:
+        #A forked worker must not share its parent's sockets, so it gets its own pool.
+        if _pool is None or _pool_pid != os.getpid():
+            _pool = ConnectionPool()
+            _pool_pid = os.getpid()
+            atexit.register(_pool.close)
+        return _pool
+
+#Defining a function to get a database connection.
+def get_db_connection():
+    """Checks out a pooled connection to the PostgreSQL database for use in a with block."""
+    return get_pool().connection()
+
+#Defining a function to report connection pool usage.
+def pool_stats():
+    """Returns the checkout, wait, connect and reconnect counts of the pool."""
+    return dict(get_pool().stats)
+
+#Defining a function to serialise rows into an in-memory CSV buffer for COPY.
+def _rows_to_csv(rows, columns):
+    """Writes rows (dicts or tuples) to a CSV buffer, using \\N for NULLs."""
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    for row in rows:
+        if isinstance(row, dict):
+            row = [row.get(c) for c in columns]
+        writer.writerow(["\\N" if v is None else v for v in row])
+    buf.seek(0)
+    return buf
+
+#Defining a function to stream rows into a temporary staging table.
+def stage_rows(cur, table, columns, rows):
+    """Copies rows into a temporary staging table shaped like `table` and returns its name."""
+    stage = f"stage_{table}"
+    cols = ", ".join(columns)
+    #The staging table only has the loaded columns, no constraints, and is dropped at commit.
+    cur.execute(f"DROP TABLE IF EXISTS pg_temp.{stage};")
+    cur.execute(f"CREATE TEMP TABLE {stage} ON COMMIT DROP AS SELECT {cols} FROM {table} WITH NO DATA;")
+    cur.copy_expert(
+        f"COPY {stage} ({cols}) FROM STDIN WITH (FORMAT csv, NULL '\\N')",
+        _rows_to_csv(rows, columns)
+    )
+    return stage
+
+#Defining a function to bulk upsert rows with one COPY and one set-based merge.
+def bulk_upsert(cur, table, columns, rows, conflict_columns, update_columns=None):
+    """Stages rows with COPY FROM STDIN, merges them into `table` and returns the inserted count.
+
+    Conflicting rows are skipped, or overwritten in `update_columns` when given. Rows
+    whose update columns already hold the staged values are left alone, so reloading
+    unchanged data writes no new row versions.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    start = time.perf_counter()
+    with metrics.span("db_write", table=table):
+        stage = stage_rows(cur, table, columns, rows)
+        cols = ", ".join(columns)
+        merge = f"""
+            INSERT INTO {table} ({cols})
+            SELECT {cols} FROM {stage}
+            ON CONFLICT ({", ".join(conflict_columns)})
+        """
+        if update_columns:
+            merge += "DO UPDATE SET " + ", ".join(f"{c} = EXCLUDED.{c}" for c in update_columns)
+            merge += (f" WHERE ({', '.join(f'{table}.{c}' for c in update_columns)}) IS DISTINCT FROM "
+                      f"({', '.join(f'EXCLUDED.{c}' for c in update_columns)})")
+            if _is_partitioned(cur, table):
+                #Partitioned tables cannot return xmax, so the staged rows that already exist are counted first.
+                cur.execute(f"SELECT COUNT(*) FROM {stage} JOIN {table} USING ({', '.join(conflict_columns)});")
+                existing = cur.fetchone()[0]
+                cur.execute(merge + ";")
+                inserted = max(0, len(rows) - existing)
+                updated = max(0, cur.rowcount - inserted)
+            else:
+                #A row version with no xmax was created by this statement; the others were updated.
+                cur.execute(f"""
+                    WITH merged AS ({merge} RETURNING xmax = 0 AS inserted)
+                    SELECT COUNT(*) FILTER (WHERE inserted), COUNT(*) FILTER (WHERE NOT inserted) FROM merged;
+                """)
+                inserted, updated = cur.fetchone()
+        else:
+            cur.execute(merge + "DO NOTHING;")
+            inserted, updated = cur.rowcount, 0
+    record_rows(table, len(rows), inserted=inserted, updated=updated)
+    elapsed = time.perf_counter() - start
+    rate = len(rows) / elapsed if elapsed > 0 else float("inf")
+    print(f"    [{table}] staged {len(rows)} rows, inserted {inserted}, updated {updated} in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return inserted
+
+#Whether each table merged into is partitioned, looked up once per process.
+_partitioned = {}
+
+#Defining a function to check whether a table is partitioned.
+def _is_partitioned(cur, table):
+    if table not in _partitioned:
+        cur.execute("SELECT relkind = 'p' FROM pg_class WHERE oid = %s::regclass;", (table,))
+        _partitioned[table] = cur.fetchone()[0]
+    return _partitioned[table]
+
+#Defining a function to count what a merge did with the rows it was given.
+def record_rows(table, staged, **outcomes):
+    """Adds a merge's outcome counts to the db_rows metric; staged rows not accounted for were skipped."""
+    for outcome, count in outcomes.items():
+        if count:
+            metrics.inc("db_rows", count, table=table, outcome=outcome)
+    skipped = staged - sum(outcomes.values())
+    if skipped > 0:
+        metrics.inc("db_rows", skipped, table=table, outcome="skipped")
+
+#Defining a function to build the "references are known" condition of a merge.
+def _known_condition(alias, references):
+    """Returns SQL that is true when each referencing column is NULL or found in its referenced table."""
+    return " AND ".join(
+        f"({alias}.{column} IS NULL OR EXISTS (SELECT 1 FROM {ref_table} r WHERE r.{ref_column} = {alias}.{column}))"
+        for column, (ref_table, ref_column) in references.items()
+    )
+
+#Defining a function to bulk merge rows whose references may not be loaded yet.
+def bulk_merge_known(cur, table, columns, rows, conflict_columns, references, unresolved_table):
+    """Stages rows with COPY and merges the ones whose references exist into `table` with a semi-join.
+
+    `references` maps a column to its (table, column). Rows that reference something not
+    in the database are parked in `unresolved_table` for resolve_unresolved to move later.
+    Returns the inserted count.
+    """
+    rows = list(rows)
+    if not rows:
+        return 0
+    start = time.perf_counter()
+    with metrics.span("db_write", table=table):
+        stage = stage_rows(cur, table, columns, rows)
+        cols = ", ".join(columns)
+        staged_cols = ", ".join(f"s.{c}" for c in columns)
+        known = _known_condition("s", references)
+        conflict = ", ".join(conflict_columns)
+        cur.execute(f"""
+            INSERT INTO {table} ({cols})
+            SELECT {staged_cols} FROM {stage} s WHERE {known}
+            ON CONFLICT ({conflict}) DO NOTHING;
+        """)
+        inserted = cur.rowcount
+        cur.execute(f"""
+            INSERT INTO {unresolved_table} ({cols})
+            SELECT {staged_cols} FROM {stage} s WHERE NOT ({known})
+            ON CONFLICT ({conflict}) DO NOTHING;
+        """)
+        parked = cur.rowcount
+    record_rows(table, len(rows), inserted=inserted, parked=parked)
+    elapsed = time.perf_counter() - start
+    rate = len(rows) / elapsed if elapsed > 0 else float("inf")
+    print(f"    [{table}] staged {len(rows)} rows, inserted {inserted}, parked {parked} unresolved in {elapsed:.2f}s ({rate:,.0f} rows/s)")
+    return inserted
+
+#Defining a function to move parked rows whose references have since been loaded.
+def resolve_unresolved(cur, table, columns, conflict_columns, references, unresolved_table):
+    """Moves the rows of `unresolved_table` that can now be merged into `table` and returns how many moved."""
+    cols = ", ".join(columns)
+    cur.execute(f"""
+        WITH moved AS (
+            DELETE FROM {unresolved_table} u WHERE {_known_condition("u", references)}
+            RETURNING {cols}
+        )
+        INSERT INTO {table} ({cols})
+        SELECT {cols} FROM moved
+        ON CONFLICT ({", ".join(conflict_columns)}) DO NOTHING;
+    """)
+    record_rows(table, cur.rowcount, resolved=cur.rowcount)
+    return cur.rowcount
+
+#Defining a function to fetch the teams of some leagues in a season.
+def fetch_teams_for_season(season, leagues):
+    """Fetches the IDs of the teams that played in the given leagues in a season from the database.
+
+    Returns an empty list when league_teams has no rows for those leagues; the caller
+    decides whether to fetch them or fall back to fetch_coached_teams_for_season.
+    """
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT DISTINCT team_id FROM league_teams WHERE season = %s AND league_id = ANY(%s);",
+                    (season, list(leagues))
+                )
+                return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        print(f"Error fetching teams for season {season} from DB: {e}")
+        return []
+
+#Defining a function to fetch the teams of a season loaded before league_teams existed.
+def fetch_coached_teams_for_season(season):
+    """Fetches the IDs of every team with a coach in a season, whatever its league."""
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT DISTINCT team_id FROM coach_history WHERE season = %s;", (season,))
+                return [row[0] for row in cur.fetchall()]
+    except Exception as e:
+        print(f"Error fetching coached teams for season {season} from DB: {e}")
+        return []
+
+#Tables partitioned by season, each with a DEFAULT partition for seasons not split out yet.
+PARTITIONED_TABLES = ("player_stats", "transfers")
+
+#Defining a function to create the season partitions a load needs.
+def ensure_season_partitions(seasons):
+    """Creates any missing per-season partitions, moving their rows out of the default partition."""
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                for table in PARTITIONED_TABLES:
+                    #Databases the migrations have not converted yet have nothing to partition.
+                    cur.execute("SELECT 1 FROM pg_partitioned_table WHERE partrelid = %s::regclass;", (table,))
+                    if not cur.fetchone():
+                        continue
+                    cur.execute("""
+                        SELECT c.relname FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+                        WHERE i.inhparent = %s::regclass;
+                    """, (table,))
+                    existing = {row[0] for row in cur.fetchall()}
+                    for season in seasons:
+                        partition = f"{table}_{int(season)}"
+                        if partition in existing:
+                            continue
+                        #Attaching needs the default partition to hold no rows of the new season.
+                        cur.execute(f"CREATE TABLE {partition} (LIKE {table} INCLUDING DEFAULTS INCLUDING CONSTRAINTS);")
+                        cur.execute(f"""
+                            WITH moved AS (DELETE FROM {table}_default WHERE season = %s RETURNING *)
+                            INSERT INTO {partition} SELECT * FROM moved;
+                        """, (season,))
+                        cur.execute(f"ALTER TABLE {table} ATTACH PARTITION {partition} FOR VALUES IN (%s);", (season,))
+                        print(f"    [{table}] created partition {partition}")
+                conn.commit()
+    except Exception as e:
+        print(f"Error creating season partitions: {e}")
@@ -0,0 +1,39 @@
+import os
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from dotenv import load_dotenv
+from utils.profiling import inherit
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Number of API requests kept in flight at once.
+API_CONCURRENCY = int(os.getenv("API_CONCURRENCY", "4"))
+
+#Defining a function to run a fetch function over many items concurrently.
+def fetch_all(fn, items, workers=API_CONCURRENCY, expand=None):
+    """Runs fn(item) for every item on a thread pool and yields (item, result) as each completes.
+
+    If given, expand(item, result) returns follow-up items (e.g. further pages) that are fetched too.
+    Only a few requests per worker are in flight or waiting at once, so a consumer that stops
+    to write holds the fetching back instead of letting responses pile up in memory.
+    """
+    executor = ThreadPoolExecutor(max_workers=workers, initializer=inherit())
+    queued = deque(items)
+    futures = {}
+    try:
+        while queued or futures:
+            while queued and len(futures) < workers * 2:
+                item = queued.popleft()
+                futures[executor.submit(fn, item)] = item
+            done, _ = wait(futures, return_when=FIRST_COMPLETED)
+            for future in done:
+                item = futures.pop(future)
+                result = future.result()
+                if expand:
+                    #Follow-up pages go first so teams finish, and are committed, one after another.
+                    queued.extendleft(reversed(expand(item, result)))
+                yield item, result
+    finally:
+        #Anything still queued is dropped if the caller stops early or a fetch raises (e.g. QuotaExhausted).
+        executor.shutdown(wait=True, cancel_futures=True)
@@ -0,0 +1,284 @@
+import os
+import json
+import time
+import atexit
+import threading
+import multiprocessing
+from collections import Counter
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Where the Prometheus textfile and the JSON run summary are written at exit ("" turns them off).
+METRICS_DIR = os.getenv("METRICS_DIR", "metrics")
+METRICS_TEXTFILE = os.getenv("METRICS_TEXTFILE", "football_loader.prom")
+METRICS_SUMMARY = os.getenv("METRICS_SUMMARY", "run_summary.json")
+#Also write every span as a JSON line to trace.jsonl, for following one slow run call by call.
+METRICS_TRACE = os.getenv("METRICS_TRACE", "0") != "0"
+
+#Prefix of every exported metric name.
+PREFIX = "football"
+
+#Span durations are counted into these buckets, in seconds.
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, float("inf"))
+
+#Help text of each metric, shown in the textfile.
+DESCRIPTIONS = {
+    "api_requests": "API responses received, by endpoint and HTTP status (error = no response).",
+    "api_response_bytes": "Bytes received from the API, as sent on the wire.",
+    "api_rate_limited": "API responses that were rate limited (429 or a rateLimit error).",
+    "api_retries": "API requests retried, by reason.",
+    "api_cache": "API lookups answered by the response cache, by result.",
+    "api_quota_remaining": "Daily API requests left, as last reported by the API.",
+    "api_request": "Time from sending an API request to receiving its response.",
+    "format": "Time spent turning API responses into records.",
+    "db_write": "Time spent staging and merging one batch into a table.",
+    "db_rows": "Rows staged for a table, by what the merge did with them.",
+    "stream_batch": "Time the stream writer spent on one batch, including sync and checkpoint commits.",
+    "export": "Time spent writing one table or season to its analytics dataset.",
+    "export_rows": "Rows written to the analytics datasets, by table.",
+}
+
+class Histogram:
+    """Counts observations into the fixed BUCKETS."""
+
+    def __init__(self):
+        self.counts = [0] * len(BUCKETS)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(BUCKETS):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.total += 1
+        self.sum += value
+
+    def merge(self, counts, total, total_sum):
+        self.counts = [a + b for a, b in zip(self.counts, counts)]
+        self.total += total
+        self.sum += total_sum
+
+    def quantile(self, q):
+        """Returns the upper bound of the bucket holding the q-th quantile."""
+        rank, seen = q * self.total, 0
+        for bound, count in zip(BUCKETS, self.counts):
+            seen += count
+            if count and seen >= rank:
+                return bound
+        return 0.0
+
+class Registry:
+    """Thread-safe counters, gauges and span histograms for one process."""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = Counter()
+        self.gauges = {}
+        self.histograms = {}
+        self.local = threading.local()
+        self.started = time.time()
+
+    def inc(self, name, value=1, **labels):
+        """Adds value to a counter."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.counters[key] += value
+        for capture_name, capture_labels, counts in getattr(self.local, "captures", ()):
+            if capture_name == name:
+                counts[tuple(labels.get(l) for l in capture_labels)] += value
+
+    def total(self, name, **labels):
+        """Returns the sum of a counter over every label set that has the given labels."""
+        with self.lock:
+            return sum(value for (n, key), value in self.counters.items()
+                       if n == name and all(dict(key).get(k) == v for k, v in labels.items()))
+
+    def set(self, name, value, **labels):
+        """Sets a gauge."""
+        with self.lock:
+            self.gauges[(name, tuple(sorted(labels.items())))] = value
+
+    def observe(self, name, seconds, **labels):
+        """Counts a duration into a span histogram."""
+        key = (name, tuple(sorted(labels.items())))
+        with self.lock:
+            self.histograms.setdefault(key, Histogram()).observe(seconds)
+
+    @contextmanager
+    def span(self, name, **labels):
+        """Times the with block into the `name` histogram, tracing it when METRICS_TRACE is on."""
+        stack = self.local.__dict__.setdefault("spans", [])
+        parent = stack[-1] if stack else None
+        stack.append(name)
+        wall, start = time.time(), time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            self.observe(name, elapsed, **labels)
+            if METRICS_TRACE and METRICS_DIR:
+                _trace(name, labels, parent, wall, elapsed)
+
+    def timed(self, records, name, **labels):
+        """Yields from an iterable, timing only the work done producing each item (not the consumer's)."""
+        iterator, elapsed = iter(records), 0.0
+        try:
+            while True:
+                start = time.perf_counter()
+                try:
+                    record = next(iterator)
+                except StopIteration:
+                    break
+                finally:
+                    elapsed += time.perf_counter() - start
+                yield record
+        finally:
+            self.observe(name, elapsed, **labels)
+
+    @contextmanager
+    def capture(self, name, *labels):
+        """Collects what this thread adds to counter `name` in the with block, keyed by the given labels' values."""
+        captures = self.local.__dict__.setdefault("captures", [])
+        counts = Counter()
+        entry = (name, labels, counts)
+        captures.append(entry)
+        try:
+            yield counts
+        finally:
+            captures.remove(entry)
+
+    def drain(self):
+        """Returns everything recorded so far as plain data and resets the registry."""
+        with self.lock:
+            snapshot = {
+                "counters": list(self.counters.items()),
+                "gauges": list(self.gauges.items()),
+                "histograms": [(key, h.counts, h.total, h.sum) for key, h in self.histograms.items()],
+            }
+            self.counters, self.gauges, self.histograms = Counter(), {}, {}
+        return snapshot
+
+    def merge(self, snapshot):
+        """Adds a drained snapshot, e.g. from a worker process, to this registry."""
+        with self.lock:
+            for key, value in snapshot["counters"]:
+                self.counters[key] += value
+            self.gauges.update(snapshot["gauges"])
+            for key, counts, total, total_sum in snapshot["histograms"]:
+                self.histograms.setdefault(key, Histogram()).merge(counts, total, total_sum)
+
+    def prometheus(self):
+        """Returns the registry in the Prometheus text exposition format."""
+        with self.lock:
+            counters = sorted(self.counters.items())
+            gauges = sorted(self.gauges.items())
+            histograms = sorted(self.histograms.items(), key=lambda item: item[0])
+        lines, described = [], set()
+
+        def header(name, kind):
+            if name not in described:
+                described.add(name)
+                base = name[len(PREFIX) + 1:].rsplit("_", 1)[0] if kind != "gauge" else name[len(PREFIX) + 1:]
+                lines.append(f"# HELP {name} {DESCRIPTIONS.get(base, base)}")
+                lines.append(f"# TYPE {name} {kind}")
+
+        for (name, labels), value in counters:
+            header(f"{PREFIX}_{name}_total", "counter")
+            lines.append(f"{PREFIX}_{name}_total{_labels(labels)} {value}")
+        for (name, labels), value in gauges:
+            header(f"{PREFIX}_{name}", "gauge")
+            lines.append(f"{PREFIX}_{name}{_labels(labels)} {value}")
+        for (name, labels), h in histograms:
+            metric = f"{PREFIX}_{name}_seconds"
+            header(metric, "histogram")
+            seen = 0
+            for bound, count in zip(BUCKETS, h.counts):
+                seen += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{metric}_bucket{_labels(labels + (('le', le),))} {seen}")
+            lines.append(f"{metric}_sum{_labels(labels)} {h.sum:.6f}")
+            lines.append(f"{metric}_count{_labels(labels)} {h.total}")
+        return "\n".join(lines) + "\n"
+
+    def summary(self):
+        """Returns a JSON-ready run summary: counters, gauges and per-span totals and percentiles."""
+        with self.lock:
+            return {
+                "started_at": self.started,
+                "finished_at": time.time(),
+                "counters": [dict(labels, metric=name, value=value) for (name, labels), value in sorted(self.counters.items())],
+                "gauges": [dict(labels, metric=name, value=value) for (name, labels), value in sorted(self.gauges.items())],
+                "spans": [dict(labels, span=name, count=h.total, total_seconds=round(h.sum, 3),
+                               avg_seconds=round(h.sum / h.total, 4) if h.total else 0.0,
+                               p50_le=h.quantile(0.5), p95_le=h.quantile(0.95))
+                          for (name, labels), h in sorted(self.histograms.items(), key=lambda item: item[0])],
+            }
+
+#Defining a function to summarise captured row outcomes for a log line.
+def describe_rows(rows, table):
+    """Returns e.g. "120 inserted, 3 updated, 40 unchanged" from a capture("db_rows", "table", "outcome") counter."""
+    outcomes = {outcome: count for (name, outcome), count in rows.items() if name == table}
+    outcomes["unchanged"] = outcomes.pop("skipped", 0)
+    return ", ".join(f"{count} {outcome}" for outcome, count in outcomes.items() if count) or "nothing written"
+
+#Defining a function to format a label set for the textfile.
+def _labels(labels):
+    """Returns {a="1",b="2"} for a tuple of label pairs, or "" when there are none."""
+    if not labels:
+        return ""
+    escaped = (str(v).replace("\\", "\\\\").replace('"', '\\"') for _, v in labels)
+    return "{" + ",".join(f'{k}="{v}"' for (k, _), v in zip(labels, escaped)) + "}"
+
+_trace_lock = threading.Lock()
+
+#Defining a function to append a span to the trace file.
+def _trace(name, labels, parent, wall, elapsed):
+    """Writes one finished span as a JSON line."""
+    line = json.dumps({"span": name, "parent": parent, "start": round(wall, 6), "seconds": round(elapsed, 6),
+                       "pid": os.getpid(), "thread": threading.current_thread().name, **labels}, default=str)
+    with _trace_lock:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        with open(os.path.join(METRICS_DIR, "trace.jsonl"), "a") as f:
+            f.write(line + "\n")
+
+#Defining a function to write a file so readers never see it half-written.
+def _write_atomic(path, text):
+    """Writes text to a temporary file and renames it over path."""
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        f.write(text)
+    os.replace(tmp, path)
+
+#Defining a function to write the metrics files.
+def write_reports():
+    """Writes the Prometheus textfile and the JSON run summary into METRICS_DIR and returns their paths."""
+    if not METRICS_DIR:
+        return []
+    try:
+        os.makedirs(METRICS_DIR, exist_ok=True)
+        textfile = os.path.join(METRICS_DIR, METRICS_TEXTFILE)
+        summary = os.path.join(METRICS_DIR, METRICS_SUMMARY)
+        _write_atomic(textfile, metrics.prometheus())
+        _write_atomic(summary, json.dumps(metrics.summary(), indent=2, default=str))
+        return [textfile, summary]
+    except Exception as e:
+        print(f"Error writing metrics: {e}")
+        return []
+
+#Defining a function to write the metrics when the process exits.
+def _write_at_exit():
+    """Writes the reports from the main process once something was recorded."""
+    #Worker processes hand their metrics to the parent instead of writing their own.
+    if multiprocessing.parent_process() is not None:
+        return
+    if metrics.counters or metrics.histograms:
+        write_reports()
+
+#The registry shared by every module in this process.
+metrics = Registry()
+atexit.register(_write_at_exit)
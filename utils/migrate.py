@@ -0,0 +1,115 @@
+import os
+import json
+import argparse
+from utils.db import get_db_connection
+
+#Schema migrations, applied once each in file name order.
+MIGRATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "migrations")
+
+#The loader lookups and dashboard queries that must be able to use an index, with the
+#partitioned table they read from when they are expected to touch a single season's partition.
+HOT_QUERIES = [
+    ("teams of a season (coach_history fallback)",
+     "SELECT DISTINCT team_id FROM coach_history WHERE season = %(season)s", None),
+    ("teams of a league and season",
+     "SELECT team_id FROM league_teams WHERE season = %(season)s AND league_id = ANY(%(leagues)s)", None),
+    ("sync state of an endpoint",
+     "SELECT entity_id, season FROM sync_state WHERE endpoint = 'players'", None),
+    ("stats of some teams in a season (aggregate refresh)",
+     "SELECT * FROM player_stats WHERE season = %(season)s AND team_id = ANY(%(teams)s)", "player_stats"),
+    ("stats of a player (player career)",
+     "SELECT * FROM player_stats WHERE player_id = %(player)s", None),
+    ("transfers of some clubs in a season (transfer spend refresh)",
+     "SELECT * FROM transfers WHERE season = ANY(%(seasons)s) AND (from_team_id = ANY(%(teams)s) OR to_team_id = ANY(%(teams)s))",
+     "transfers"),
+    ("transfers of a player (player career)",
+     "SELECT * FROM transfers WHERE player_id = %(player)s", None),
+    ("trophies of some players (trophy counts)",
+     "SELECT * FROM trophies WHERE player_id = ANY(%(players)s)", None),
+    ("trophies of some coaches (trophy counts)",
+     "SELECT * FROM trophies WHERE coach_id = ANY(%(coaches)s)", None),
+    ("coaches of a team in a season (team profile)",
+     "SELECT coach_id FROM coach_history WHERE team_id = %(team)s AND season = %(season)s", None),
+]
+
+#Defining a function to list the migrations a database has not had yet.
+def pending_migrations():
+    """Returns the names of the migrations in migrations/ not applied to this database, in order, without changing it."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT to_regclass('schema_migrations') IS NOT NULL;")
+            applied = set()
+            if cur.fetchone()[0]:
+                cur.execute("SELECT name FROM schema_migrations;")
+                applied = {row[0] for row in cur.fetchall()}
+    return [name for name in sorted(os.listdir(MIGRATIONS_DIR)) if name.endswith(".sql") and name not in applied]
+
+#Defining a function to apply the pending migrations.
+def apply_migrations():
+    """Runs every migration in migrations/ that this database has not had yet, each in its own transaction."""
+    for name in pending_migrations():
+        print(f"Applying migration {name}...")
+        with open(os.path.join(MIGRATIONS_DIR, name)) as f:
+            sql = f.read()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                cur.execute("INSERT INTO schema_migrations (name) VALUES (%s);", (name,))
+            conn.commit()
+
+#Defining a function to collect the scans in a JSON plan.
+def _plan_scans(plan, scans):
+    """Appends (node type, relation, index, whether the index is searched) for every scan node in the plan tree."""
+    if "Relation Name" in plan or "Index Name" in plan:
+        scans.append((plan["Node Type"], plan.get("Relation Name"), plan.get("Index Name"), "Index Cond" in plan))
+    for child in plan.get("Plans", []):
+        _plan_scans(child, scans)
+    return scans
+
+#Defining a function to check the hot queries' plans.
+def check_query_plans():
+    """EXPLAINs every hot query and returns True if each can use an index and touches one season's partition where expected.
+
+    Sequential scans are disabled for the check, so a small database still shows whether
+    a usable index exists rather than whether the planner would bother with it.
+    """
+    ok = True
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT COALESCE(MAX(season), 2021) FROM player_stats;")
+            season = cur.fetchone()[0]
+            params = {"season": season, "seasons": [season], "leagues": [39], "teams": [1, 2],
+                      "player": 1, "players": [1, 2], "coaches": [1, 2], "team": 1}
+            cur.execute("SET LOCAL enable_seqscan = off;")
+            for description, sql, partitioned in HOT_QUERIES:
+                cur.execute("EXPLAIN (FORMAT JSON) " + sql, params)
+                plan = cur.fetchone()[0]
+                if isinstance(plan, str):
+                    plan = json.loads(plan)
+                scans = _plan_scans(plan[0]["Plan"], [])
+                seq_scans = {rel for node, rel, _, _ in scans if node == "Seq Scan"}
+                #An index read from end to end only stands in for a sequential scan.
+                unsearched = {index for _, _, index, searched in scans if index and not searched}
+                indexes = sorted({index for _, _, index, searched in scans if index and searched})
+                problems = []
+                if seq_scans:
+                    problems.append(f"sequential scan of {', '.join(sorted(seq_scans))}")
+                if unsearched:
+                    problems.append(f"full scan of {', '.join(sorted(unsearched))}")
+                if partitioned:
+                    touched = {rel for _, rel, _, _ in scans if rel and rel.startswith(partitioned + "_")}
+                    if touched - {f"{partitioned}_{season}"}:
+                        problems.append(f"reads partitions {', '.join(sorted(touched))}")
+                status = "FAIL" if problems else "ok"
+                ok = ok and not problems
+                print(f"  [{status}] {description}: {', '.join(problems) or ', '.join(indexes)}")
+    return ok
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Apply the schema migrations and check the hot queries' plans.")
+    parser.add_argument("--check", action="store_true", help="only EXPLAIN the hot queries and report whether they use indexes")
+    args = parser.parse_args()
+    if not args.check:
+        apply_migrations()
+    print("Hot query plans:")
+    exit(0 if check_query_plans() else 1)
@@ -0,0 +1,251 @@
+import os
+import math
+import threading
+from collections import namedtuple
+from dotenv import load_dotenv
+from utils.db import get_db_connection, fetch_coached_teams_for_season
+from utils.api import client
+from utils.ratelimit import limiter
+from utils.metrics import metrics
+from utils.sync import SyncTracker, CURRENT_SEASON, NO_SEASON, is_fresh
+from utils.checkpoint import Checkpoint
+from utils import config, archive, checkpoint
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Share of the remaining daily quota a run may spend; the rest is kept for other runs and retries.
+QUOTA_SHARE = float(os.getenv("QUOTA_SHARE", "0.9"))
+#Guesses for what has not been loaded yet: teams per league, players per squad, coaches per team.
+PLAN_TEAMS_PER_LEAGUE = int(os.getenv("PLAN_TEAMS_PER_LEAGUE", "20"))
+PLAN_SQUAD_SIZE = int(os.getenv("PLAN_SQUAD_SIZE", "30"))
+PLAN_COACHES_PER_TEAM = int(os.getenv("PLAN_COACHES_PER_TEAM", "2"))
+
+#Players returned per page of /players.
+PLAYERS_PAGE_SIZE = 20
+
+#Estimated API calls of one stage partition (season is None for stages that cover every season).
+Estimate = namedtuple("Estimate", ["stage", "season", "units", "calls"])
+
+#Defining a function to order seasons by priority.
+def order_seasons(seasons):
+    """Returns the seasons with the current one first, then the most recent ones."""
+    return sorted(seasons, key=lambda s: (s != CURRENT_SEASON, -s))
+
+#Defining a function to count the work a loader still has to fetch.
+def _todo(endpoint, entity_ids, seasons, checkpoint_season=NO_SEASON):
+    """Returns the entities a loader would fetch: stale ones, minus those a resumed run has finished."""
+    state = SyncTracker(endpoint).state
+    todo = [e for e in entity_ids if any(not is_fresh(state.get((e, s), (None, None))[0], s) for s in seasons)]
+    if checkpoint.RESUME:
+        done = Checkpoint(endpoint, checkpoint_season).completed
+        todo = [e for e in todo if e not in done]
+    return todo
+
+#Defining a function to read which configured leagues' teams are loaded for a season.
+def _league_teams(season):
+    """Returns {league_id: [team_id, ...]} from league_teams for the configured leagues that have rows."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT league_id, team_id FROM league_teams WHERE season = %s AND league_id = ANY(%s);",
+                        (season, list(config.LEAGUES)))
+            leagues = {}
+            for league_id, team_id in cur.fetchall():
+                leagues.setdefault(league_id, []).append(team_id)
+    return leagues
+
+#Defining a function to find the teams known for a season.
+def _season_teams(season):
+    """Returns the team IDs in the database for a season and how many teams are not loaded yet.
+
+    Every configured league without league_teams rows counts PLAN_TEAMS_PER_LEAGUE missing
+    teams. Only when no league has rows are the season's teams in coach_history used, as
+    the loaders do for seasons loaded before league_teams existed.
+    """
+    leagues = _league_teams(season)
+    known = set().union(*leagues.values())
+    missing = PLAN_TEAMS_PER_LEAGUE * len(set(config.LEAGUES) - set(leagues))
+    if not known:
+        known = set(fetch_coached_teams_for_season(season))
+        if known:
+            missing = 0
+    return sorted(known), missing
+
+#Defining a function to estimate the teams stage.
+def estimate_teams(season):
+    """One call per league whose team list is stale or not in league_teams, plus one per team whose coaches are stale."""
+    teams_state = SyncTracker("teams").state
+    loaded = _league_teams(season)
+    leagues = [l for l in config.LEAGUES
+               if l not in loaded or not is_fresh(teams_state.get((l, season), (None, None))[0], season)]
+    known, missing = _season_teams(season)
+    coaches = _todo("coachs", known, [season], season)
+    return Estimate("teams", season, len(known) + missing, len(leagues) + len(coaches) + missing)
+
+#Defining a function to estimate the players stage.
+def estimate_players(season):
+    """One call per page of every stale team's squad, sized from what is loaded already."""
+    known, missing = _season_teams(season)
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT team_id, COUNT(*) FROM player_stats WHERE season = %s GROUP BY team_id;", (season,))
+            squads = dict(cur.fetchall())
+    pages = lambda players: max(1, math.ceil(players / PLAYERS_PAGE_SIZE))
+    todo = _todo("players", known, [season], season)
+    calls = sum(pages(squads.get(t, PLAN_SQUAD_SIZE)) for t in todo) + missing * pages(PLAN_SQUAD_SIZE)
+    return Estimate("players", season, len(known) + missing, calls)
+
+#Defining a function to estimate the transfers stage.
+def estimate_transfers(seasons):
+    """One call per team that is stale in any season."""
+    known, missing = set(), 0
+    for season in seasons:
+        teams, season_missing = _season_teams(season)
+        known.update(teams)
+        missing = max(missing, season_missing)
+    todo = _todo("transfers", sorted(known), list(seasons))
+    return Estimate("transfers", None, len(known) + missing, len(todo) + missing)
+
+#Defining a function to estimate the trophies stage.
+def estimate_trophies(seasons):
+    """One call per stale player and coach, including those the earlier stages are expected to add."""
+    with get_db_connection() as conn:
+        with conn.cursor() as cur:
+            cur.execute("SELECT player_id FROM players;")
+            players = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT coach_id FROM coaches;")
+            coaches = [row[0] for row in cur.fetchall()]
+            cur.execute("SELECT season, COUNT(DISTINCT team_id) FROM player_stats WHERE season = ANY(%s) GROUP BY season;",
+                        (list(seasons),))
+            loaded = dict(cur.fetchall())
+    new_players = new_coaches = 0
+    for season in seasons:
+        known, missing = _season_teams(season)
+        new_players += (max(0, len(known) - loaded.get(season, 0)) + missing) * PLAN_SQUAD_SIZE
+        new_coaches += missing * PLAN_COACHES_PER_TEAM
+    todo = len(_todo("trophies/player", players, [NO_SEASON])) + len(_todo("trophies/coach", coaches, [NO_SEASON]))
+    return Estimate("trophies", None, len(players) + len(coaches) + new_players + new_coaches,
+                    todo + new_players + new_coaches)
+
+#Estimator of each stage that calls the API; other stages cost nothing.
+ESTIMATORS = {
+    "teams": estimate_teams,
+    "players": estimate_players,
+    "transfers": lambda season: estimate_transfers(config.SEASONS),
+    "trophies": lambda season: estimate_trophies(config.SEASONS),
+}
+
+#Defining a function to estimate one stage partition.
+def estimate(stage, season):
+    """Returns the Estimate of a stage for a season (None for stages covering every season)."""
+    if archive.REPLAY or stage not in ESTIMATORS:
+        return Estimate(stage, season, 0, 0)
+    return ESTIMATORS[stage](season)
+
+#Defining a function to ask the API how much of today's quota is left.
+def quota_remaining():
+    """Returns the requests left today according to /status, or the limiter's own count if that fails."""
+    try:
+        requests_today = client.status()["response"]["requests"]
+        return max(0, requests_today["limit_day"] - requests_today["current"])
+    except Exception as e:
+        print(f"Error reading the API quota status, using the configured daily limit: {e}")
+        return limiter.day_remaining
+
+#Defining a function to count the API calls this run has made.
+def _calls_made():
+    """Returns the requests that reached the API so far, including those of sharded workers."""
+    return metrics.total("api_requests") - metrics.total("api_requests", status="error")
+
+class QuotaPlan:
+    """Starts stage partitions, in priority order, only while their estimated calls fit the run's budget.
+
+    A partition that does not fit is skipped whole rather than started and cut off partway.
+    The limiter is capped at the budget too, in case a partition costs more than estimated.
+    """
+
+    def __init__(self, budget, remaining=None):
+        self.budget = budget
+        self.remaining = remaining
+        self.reserved = {}
+        self.skipped = []
+        self.made_before = _calls_made()
+        self.lock = threading.Lock()
+        if budget is not None:
+            limiter.cap(budget)
+
+    def left(self):
+        """Returns the budget not spent or reserved by running partitions."""
+        return self.budget - (_calls_made() - self.made_before) - sum(self.reserved.values())
+
+    def admit(self, stage, season):
+        """Reserves a partition's estimated calls and returns True, or records it as skipped and returns False."""
+        if self.budget is None:
+            return True
+        try:
+            planned = estimate(stage, season)
+        except Exception as e:
+            print(f"Error estimating {stage}: {e}")
+            planned = Estimate(stage, season, 0, 0)
+        with self.lock:
+            left = self.left()
+            if planned.calls > left:
+                self.skipped.append(planned)
+                print(f"⏸ Skipping {_label(stage, season)}: about {planned.calls} calls, {left} left in this run's budget.")
+                return False
+            self.reserved[(stage, season)] = planned.calls
+        return True
+
+    def release(self, stage, season):
+        """Drops a finished partition's reservation; its real calls are counted from then on."""
+        with self.lock:
+            self.reserved.pop((stage, season), None)
+
+    def summary(self):
+        """Returns lines describing what the run spent and what it left for later."""
+        if self.budget is None:
+            return []
+        lines = [f"API calls: {_calls_made() - self.made_before} made of a budget of {self.budget} "
+                 f"({self.remaining} were left today)."]
+        if self.skipped:
+            lines.append("Skipped to stay within the budget, rerun once the quota resets: "
+                         + ", ".join(f"{_label(e.stage, e.season)} (~{e.calls} calls)" for e in self.skipped))
+        return lines
+
+#Defining a function to name a stage partition.
+def _label(stage, season):
+    return stage if season is None else f"{stage}[{season}]"
+
+#Defining a function to set up the plan of a run.
+def make_plan(share=QUOTA_SHARE):
+    """Returns a QuotaPlan with a budget of `share` of the requests left today (unlimited when replaying)."""
+    if archive.REPLAY:
+        return QuotaPlan(None)
+    remaining = quota_remaining()
+    return QuotaPlan(int(remaining * share), remaining)
+
+#Defining a function to print what a run would cost.
+def print_plan(partitions, share=QUOTA_SHARE):
+    """Prints each stage partition's estimated calls, in run order, and which of them today's budget covers.
+
+    partitions is a list of (stage, season, upstream) where upstream holds the (stage, season)
+    partitions it builds on; a partition is skipped with them, as in a real run.
+    """
+    remaining = quota_remaining()
+    budget = int(remaining * share)
+    print(f"\nAPI quota: {remaining} requests left today, this run may use {budget} ({share:.0%}).")
+    print(f"  {'stage':<18} {'units':>8} {'calls':>8} {'cumulative':>11}")
+    total, skipped = 0, set()
+    for stage, season, upstream in partitions:
+        planned = estimate(stage, season)
+        if upstream & skipped:
+            note = "would be skipped with its upstream stage"
+        elif total + planned.calls > budget:
+            note = "over budget, would be skipped"
+        else:
+            note = ""
+            total += planned.calls
+        if note:
+            skipped.add((stage, season))
+        print(f"  {_label(stage, season):<18} {planned.units:>8} {planned.calls:>8} {total:>11}  {note}")
+    print("Estimates for stages whose inputs are not loaded yet use PLAN_TEAMS_PER_LEAGUE, PLAN_SQUAD_SIZE and PLAN_COACHES_PER_TEAM.")
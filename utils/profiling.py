@@ -0,0 +1,217 @@
+import os
+import re
+import sys
+import time
+import pstats
+import cProfile
+import functools
+import inspect
+import threading
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from dotenv import load_dotenv
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Where per-stage profiles are written and how often the sampler looks at every thread's stack.
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_SAMPLE_MS = float(os.getenv("PROFILE_SAMPLE_MS", "5"))
+
+#Whether stages are profiled; set by --profile.
+PROFILE = False
+
+#Built-ins that only wait on other threads, the network or a timer; left out of the printed hot spots.
+WAITS = ("acquire", "sleep", "poll", "select", "recv_into", "of '_queue.SimpleQueue' objects")
+
+#Thread ident -> the StageProfile it works for; the sampler only records these threads.
+_thread_stages = {}
+_local = threading.local()
+_lock = threading.Lock()
+_active = 0
+_sampler = None
+
+class StageProfile:
+    """The cProfile runs, sampled stacks and allocation peaks collected for one stage."""
+
+    def __init__(self, name):
+        self.name = name
+        self.profiles = []
+        self.stacks = Counter()
+        self.allocations = {}
+        self.lock = threading.Lock()
+
+    def attach(self):
+        """Profiles the calling thread as part of this stage."""
+        _thread_stages[threading.get_ident()] = self
+        _local.stage = self
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            #Python 3.12+ allows one cProfile at a time; the sampler still covers this thread.
+            profile = None
+        _local.profile = profile
+        if profile is not None:
+            with self.lock:
+                self.profiles.append(profile)
+
+    def detach(self):
+        """Stops profiling the calling thread."""
+        profile = getattr(_local, "profile", None)
+        if profile is not None:
+            profile.disable()
+        _local.profile = _local.stage = None
+        _thread_stages.pop(threading.get_ident(), None)
+
+    def record_allocation(self, name, peak, net):
+        with self.lock:
+            calls, max_peak, total_net = self.allocations.get(name, (0, 0, 0))
+            self.allocations[name] = (calls + 1, max(max_peak, peak), total_net + net)
+
+    def write(self):
+        """Writes <stage>.pstats, <stage>.collapsed and <stage>.allocations.txt and returns the pstats."""
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        #"players[2018]" is written as players-2018.*
+        base = os.path.join(PROFILE_DIR, re.sub(r"[^\w.]+", "-", self.name).strip("-"))
+        stats = None
+        for profile in self.profiles:
+            if stats is None:
+                stats = pstats.Stats(profile)
+            else:
+                stats.add(profile)
+        if stats is not None:
+            stats.dump_stats(f"{base}.pstats")
+        #One "frame;frame;frame count" line per distinct stack, as flamegraph.pl and speedscope read them.
+        with open(f"{base}.collapsed", "w") as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        with open(f"{base}.allocations.txt", "w") as f:
+            f.write(f"{'function':<40} {'calls':>8} {'peak KiB':>12} {'net KiB':>12}\n")
+            for name, (calls, peak, net) in sorted(self.allocations.items(), key=lambda item: -item[1][1]):
+                f.write(f"{name:<40} {calls:>8} {peak / 1024:>12.1f} {net / 1024:>12.1f}\n")
+        return stats
+
+#Defining a function to name a frame in a collapsed stack.
+def _frame_label(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+#Defining the sampler thread's loop.
+def _sample():
+    """Adds the current stack of every stage thread to its stage until no stage is running."""
+    interval = PROFILE_SAMPLE_MS / 1000
+    me = threading.get_ident()
+    while _active:
+        for ident, frame in sys._current_frames().items():
+            stage = _thread_stages.get(ident)
+            if stage is None or ident == me:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_label(frame))
+                frame = frame.f_back
+            with stage.lock:
+                stage.stacks[";".join(reversed(stack))] += 1
+        time.sleep(interval)
+
+#Defining a function to profile one stage.
+@contextmanager
+def profile_stage(name):
+    """Profiles the with block, and the threads it starts through inherit(), as one stage when --profile is on."""
+    global _active, _sampler
+    if not PROFILE:
+        yield
+        return
+    stage = StageProfile(name)
+    with _lock:
+        _active += 1
+        if not tracemalloc.is_tracing():
+            tracemalloc.start()
+        if _sampler is None or not _sampler.is_alive():
+            _sampler = threading.Thread(target=_sample, name="profile-sampler", daemon=True)
+            _sampler.start()
+    stage.attach()
+    try:
+        yield stage
+    finally:
+        stage.detach()
+        #Pool threads of the stage that were never detached stop being sampled.
+        for ident in [i for i, s in list(_thread_stages.items()) if s is stage]:
+            _thread_stages.pop(ident, None)
+        with _lock:
+            _active -= 1
+            if not _active:
+                tracemalloc.stop()
+        report(stage, stage.write())
+
+#Defining a function to print a stage's hot spots.
+def report(stage, stats, top=8):
+    """Prints the functions with the most own time (waits aside) and the largest allocation peaks of a stage."""
+    print(f"    [profile] {stage.name}: {sum(stage.stacks.values())} stack samples, profiles in {PROFILE_DIR}/")
+    if stats is not None:
+        busy = [item for item in stats.stats.items() if not any(w in item[0][2] for w in WAITS)]
+        hottest = sorted(busy, key=lambda item: -item[1][2])[:top]
+        for (filename, line, function), (_, calls, tottime, cumtime, _) in hottest:
+            print(f"      {tottime:8.3f}s own {cumtime:8.3f}s cum {calls:>8} calls  {function} ({os.path.basename(filename)}:{line})")
+    for name, (calls, peak, net) in sorted(stage.allocations.items(), key=lambda item: -item[1][1])[:top]:
+        print(f"      {name}: {calls} calls, peak {peak / 1024:.1f} KiB, net {net / 1024:.1f} KiB")
+
+#Defining a function to carry the current stage over to a new thread.
+def inherit(target=None):
+    """Wraps a thread target so it is profiled with the calling thread's stage.
+
+    Without a target, returns a ThreadPoolExecutor initializer that does the same
+    (or None when nothing is being profiled).
+    """
+    stage = getattr(_local, "stage", None) if PROFILE else None
+    if target is None:
+        return stage.attach if stage else None
+    if stage is None:
+        return target
+
+    @functools.wraps(target)
+    def run(*args, **kwargs):
+        stage.attach()
+        try:
+            return target(*args, **kwargs)
+        finally:
+            stage.detach()
+    return run
+
+#Defining a function to measure how much a function allocates.
+def _measure(stage, name, call):
+    start, _ = tracemalloc.get_traced_memory()
+    #Other threads allocate (and reset the peak) meanwhile too, so under concurrency the peak is approximate.
+    tracemalloc.reset_peak()
+    try:
+        return call()
+    finally:
+        current, peak = tracemalloc.get_traced_memory()
+        stage.record_allocation(name, max(0, peak - start), current - start)
+
+#Defining a decorator that records allocation peaks while profiling.
+def track_allocations(fn):
+    """Records the tracemalloc peak of each call (or of consuming each generator) in the stage's profile."""
+    name = fn.__qualname__
+    if inspect.isgeneratorfunction(fn):
+        @functools.wraps(fn)
+        def generator(*args, **kwargs):
+            stage = getattr(_local, "stage", None)
+            if stage is None or not tracemalloc.is_tracing():
+                yield from fn(*args, **kwargs)
+                return
+            records = []
+            #Formatting is measured as a whole; the records are then handed on one by one.
+            _measure(stage, name, lambda: records.extend(fn(*args, **kwargs)))
+            yield from records
+        return generator
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        stage = getattr(_local, "stage", None)
+        if stage is None or not tracemalloc.is_tracing():
+            return fn(*args, **kwargs)
+        return _measure(stage, name, lambda: fn(*args, **kwargs))
+    return wrapper
@@ -0,0 +1,375 @@
+import os
+import json
+import time
+import select
+import argparse
+import threading
+from collections import OrderedDict, namedtuple, defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+import psycopg2
+from dotenv import load_dotenv
+from utils.db import get_db_connection
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#How many results are cached and for how long, as a backstop to the loaders' invalidations.
+QUERY_CACHE_ENTRIES = int(os.getenv("QUERY_CACHE_ENTRIES", "2048"))
+QUERY_CACHE_TTL_SECONDS = float(os.getenv("QUERY_CACHE_TTL_SECONDS", "300"))
+
+#Channel the loaders notify with the tags (e.g. "team:33", "season:2021") of what they wrote.
+INVALIDATION_CHANNEL = "query_cache"
+#NOTIFY payloads must stay under 8000 bytes, so long tag lists are split into several notifications.
+NOTIFY_PAYLOAD_BYTES = 7900
+
+#Typed results returned by the query functions.
+TeamSeasonProfile = namedtuple("TeamSeasonProfile", [
+    "team_id", "name", "country", "founded", "stadium_name", "season", "players", "appearances",
+    "goals", "assists", "minutes_played", "spent", "received", "net_spend", "coaches"])
+Coach = namedtuple("Coach", ["coach_id", "name", "nationality"])
+PlayerCareer = namedtuple("PlayerCareer", ["player_id", "name", "nationality", "birthdate", "seasons", "transfers", "trophies"])
+PlayerSeason = namedtuple("PlayerSeason", ["season", "team_id", "team_name", "appearances", "goals", "assists", "minutes_played"])
+PlayerTransfer = namedtuple("PlayerTransfer", ["date", "season", "from_team_id", "to_team_id", "transfer_fee"])
+PlayerTrophy = namedtuple("PlayerTrophy", ["name", "season", "result"])
+LeaderboardEntry = namedtuple("LeaderboardEntry", ["rank", "player_id", "player_name", "team_id", "team_name", "value"])
+
+#Statements prepared once on each pooled connection and then run with EXECUTE.
+STATEMENTS = {
+    "q_team_profile": """
+        SELECT t.team_id, t.name, t.country, t.founded, t.stadium_name, $2::int,
+               s.players, s.appearances, s.goals, s.assists, s.minutes_played,
+               sp.spent, sp.received, sp.net_spend
+        FROM teams t
+        LEFT JOIN team_season_summary s ON s.team_id = t.team_id AND s.season = $2
+        LEFT JOIN team_transfer_spend sp ON sp.team_id = t.team_id AND sp.season = $2
+        WHERE t.team_id = $1
+    """,
+    "q_team_coaches": """
+        SELECT c.coach_id, c.name, c.nationality
+        FROM coach_history h JOIN coaches c ON c.coach_id = h.coach_id
+        WHERE h.team_id = $1 AND h.season = $2
+        ORDER BY c.name
+    """,
+    "q_player": "SELECT player_id, name, nationality, birthdate FROM players WHERE player_id = $1",
+    "q_player_seasons": """
+        SELECT s.season, s.team_id, t.name, s.appearances, s.goals, s.assists, s.minutes_played
+        FROM player_stats s LEFT JOIN teams t ON t.team_id = s.team_id
+        WHERE s.player_id = $1
+        ORDER BY s.season, s.team_id
+    """,
+    "q_player_transfers": """
+        SELECT date, season, from_team_id, to_team_id, transfer_fee
+        FROM transfers WHERE player_id = $1 ORDER BY date
+    """,
+    "q_player_trophies": """
+        SELECT name, season, result FROM trophies WHERE player_id = $1 ORDER BY season NULLS LAST, name
+    """,
+    "q_leaderboard": """
+        SELECT l.rank, l.player_id, p.name, l.team_id, t.name, l.value
+        FROM season_leaderboards l
+        JOIN players p ON p.player_id = l.player_id
+        LEFT JOIN teams t ON t.team_id = l.team_id
+        WHERE l.season = $1 AND l.category = $2 AND l.rank <= $3
+        ORDER BY l.rank
+    """,
+}
+
+#Connections (by object and backend) that already have the statements prepared.
+_prepared = set()
+_prepared_lock = threading.Lock()
+
+class ResultCache:
+    """In-process LRU cache of query results with a TTL and invalidation by tag."""
+
+    def __init__(self, max_entries=QUERY_CACHE_ENTRIES, ttl_seconds=QUERY_CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.entries = OrderedDict()
+        self.tags = defaultdict(set)
+        self.lock = threading.Lock()
+        #Bumped by every invalidation, so a result loaded across one is not cached.
+        self.generation = 0
+        self.stats = {"hits": 0, "misses": 0, "expired": 0, "evicted": 0, "invalidated": 0}
+
+    def get(self, key):
+        """Returns (True, result) for a live entry, else (False, None)."""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return False, None
+            value, expires_at, _ = entry
+            if time.monotonic() > expires_at:
+                self._drop(key)
+                self.stats["expired"] += 1
+                self.stats["misses"] += 1
+                return False, None
+            self.entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return True, value
+
+    def put(self, key, value, tags, generation):
+        """Stores a result under the tags of the rows it was built from, unless an invalidation came in since it was loaded."""
+        with self.lock:
+            if generation != self.generation:
+                return
+            if key in self.entries:
+                self._drop(key)
+            self.entries[key] = (value, time.monotonic() + self.ttl_seconds, tags)
+            for tag in tags:
+                self.tags[tag].add(key)
+            while len(self.entries) > self.max_entries:
+                self._drop(next(iter(self.entries)))
+                self.stats["evicted"] += 1
+
+    def invalidate(self, tags):
+        """Drops every result built from rows with any of the tags."""
+        with self.lock:
+            self.generation += 1
+            for tag in tags:
+                for key in self.tags.pop(tag, ()):
+                    if key in self.entries:
+                        self._drop(key)
+                        self.stats["invalidated"] += 1
+
+    def _drop(self, key):
+        _, _, tags = self.entries.pop(key)
+        for tag in tags:
+            keys = self.tags.get(tag)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self.tags[tag]
+
+#Module-level result cache shared by the query functions.
+result_cache = ResultCache()
+
+#Recent latencies per query function, for the p50/p99 in the service's stats.
+_latencies = defaultdict(lambda: deque(maxlen=10000))
+
+#Defining a function to run a prepared statement.
+def _execute(conn, name, params):
+    """Runs a prepared statement on a pooled connection, preparing all of them on first use."""
+    key = (id(conn), conn.get_backend_pid())
+    with _prepared_lock:
+        prepared = key in _prepared
+    with conn.cursor() as cur:
+        if not prepared:
+            #A failed earlier attempt may have left some of them behind.
+            cur.execute("DEALLOCATE ALL;")
+            for statement, sql in STATEMENTS.items():
+                cur.execute(f"PREPARE {statement} AS {sql};")
+            with _prepared_lock:
+                _prepared.add(key)
+        cur.execute(f"EXECUTE {name} ({', '.join(['%s'] * len(params))});", params)
+        return cur.fetchall()
+
+#Defining a function to serve a query from the cache or the database.
+def _cached(key, tags, load):
+    """Returns the cached result for key, or runs load(conn) and caches it under tags(result)."""
+    start = time.perf_counter()
+    generation = result_cache.generation
+    hit, value = result_cache.get(key)
+    if not hit:
+        with get_db_connection() as conn:
+            value = load(conn)
+        result_cache.put(key, value, tags(value), generation)
+    _latencies[key[0]].append((time.perf_counter() - start) * 1000)
+    return value
+
+#Defining a function to get a team's profile for a season.
+def team_season_profile(team_id, season):
+    """Returns a team's details, season totals, transfer spend and coaches, or None for an unknown team."""
+    def load(conn):
+        rows = _execute(conn, "q_team_profile", (team_id, season))
+        if not rows:
+            return None
+        coaches = [Coach(*row) for row in _execute(conn, "q_team_coaches", (team_id, season))]
+        return TeamSeasonProfile(*rows[0], coaches)
+    return _cached(("team_season_profile", team_id, season), lambda _: {f"team:{team_id}", f"season:{season}"}, load)
+
+#Defining a function to get a player's career.
+def player_career(player_id):
+    """Returns a player's details with their stats per season, transfers and trophies, or None for an unknown player."""
+    def load(conn):
+        rows = _execute(conn, "q_player", (player_id,))
+        if not rows:
+            return None
+        seasons = [PlayerSeason(*row) for row in _execute(conn, "q_player_seasons", (player_id,))]
+        transfers = [PlayerTransfer(*row) for row in _execute(conn, "q_player_transfers", (player_id,))]
+        trophies = [PlayerTrophy(*row) for row in _execute(conn, "q_player_trophies", (player_id,))]
+        return PlayerCareer(*rows[0], seasons, transfers, trophies)
+
+    def tags(career):
+        #A career changes when any team the player played for, or moved between, is reloaded.
+        tags = {f"player:{player_id}"}
+        if career:
+            tags.update(f"team:{s.team_id}" for s in career.seasons)
+            tags.update(f"team:{t}" for tr in career.transfers for t in (tr.from_team_id, tr.to_team_id) if t)
+        return tags
+    return _cached(("player_career", player_id), tags, load)
+
+#Defining a function to get a season's leaderboard.
+def leaderboard(season, category="goals", limit=10):
+    """Returns a season's top scorers ("goals") or assisters ("assists")."""
+    def load(conn):
+        return [LeaderboardEntry(*row) for row in _execute(conn, "q_leaderboard", (season, category, limit))]
+    return _cached(("leaderboard", season, category, limit), lambda _: {f"season:{season}"}, load)
+
+#Defining a function to split tags into NOTIFY payloads.
+def _payloads(tags):
+    """Yields comma-joined runs of the tags, each under NOTIFY_PAYLOAD_BYTES when encoded."""
+    chunk, size = [], 0
+    for tag in tags:
+        length = len(tag.encode()) + 1
+        if chunk and size + length > NOTIFY_PAYLOAD_BYTES:
+            yield ",".join(chunk)
+            chunk, size = [], 0
+        chunk.append(tag)
+        size += length
+    if chunk:
+        yield ",".join(chunk)
+
+#Defining a function to tell every query service what a load changed.
+def notify_changed(cur, tags):
+    """Queues an invalidation of the tags; it is delivered to listening services when the transaction commits."""
+    tags = sorted(tags)
+    for payload in _payloads(tags):
+        cur.execute("SELECT pg_notify(%s, %s);", (INVALIDATION_CHANNEL, payload))
+    result_cache.invalidate(tags)
+
+#Defining a function to check that long tag lists fit into NOTIFY payloads.
+def check_payloads():
+    """Splits long lists of realistic tags and returns True if every payload fits and no tag is lost."""
+    ok = True
+    cases = {
+        "8-digit player IDs": [f"player:{10000000 + i}" for i in range(20000)],
+        "mixed tags": [f"{kind}:{i}" for i in range(5000) for kind in ("team", "season", "player", "coach")],
+        "one tag": ["season:2021"],
+    }
+    for label, tags in cases.items():
+        payloads = list(_payloads(sorted(tags)))
+        largest = max(len(p.encode()) for p in payloads)
+        intact = sorted(t for p in payloads for t in p.split(",")) == sorted(tags)
+        fits = largest < 8000
+        ok = ok and fits and intact
+        print(f"{'OK  ' if fits and intact else 'FAIL'} {label}: {len(tags)} tags in {len(payloads)} payloads, largest {largest} bytes")
+    return ok
+
+#Defining a function to invalidate results outside an existing transaction.
+def invalidate(tags):
+    """Notifies every query service that rows with the tags have changed."""
+    if not tags:
+        return
+    try:
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                notify_changed(cur, tags)
+            conn.commit()
+    except Exception as e:
+        print(f"Error invalidating cached query results: {e}")
+
+#Defining a function to apply the loaders' invalidations as they arrive.
+def start_invalidation_listener():
+    """Starts a thread that LISTENs for the loaders' notifications and invalidates the matching results."""
+    def listen():
+        while True:
+            try:
+                conn = psycopg2.connect(os.getenv("NEON_DB_URL"))
+                conn.autocommit = True
+                with conn.cursor() as cur:
+                    cur.execute(f"LISTEN {INVALIDATION_CHANNEL};")
+                #Anything written while the listener was down is unknown, so start from an empty cache.
+                result_cache.invalidate(list(result_cache.tags))
+                while True:
+                    if select.select([conn], [], [], 60) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        result_cache.invalidate(conn.notifies.pop(0).payload.split(","))
+            except psycopg2.Error as e:
+                print(f"Error listening for cache invalidations, reconnecting: {e}")
+                time.sleep(5)
+    thread = threading.Thread(target=listen, daemon=True)
+    thread.start()
+    return thread
+
+#Defining a function to summarise the service's latencies and cache use.
+def query_stats():
+    """Returns the cache counters and the p50/p99 latency in ms of each query function."""
+    latencies = {}
+    for name, samples in list(_latencies.items()):
+        ordered = sorted(samples)
+        if ordered:
+            latencies[name] = {
+                "count": len(ordered),
+                "p50_ms": round(ordered[len(ordered) // 2], 3),
+                "p99_ms": round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 3),
+            }
+    return {"cache": dict(result_cache.stats, entries=len(result_cache.entries)), "latency": latencies}
+
+#Defining a function to turn query results into JSON-friendly values.
+def _jsonable(value):
+    if hasattr(value, "_asdict"):
+        return {k: _jsonable(v) for k, v in value._asdict().items()}
+    if isinstance(value, list):
+        return [_jsonable(v) for v in value]
+    return value
+
+class QueryHandler(BaseHTTPRequestHandler):
+    """Serves the query functions as JSON:
+
+    /teams/<team_id>/seasons/<season>, /players/<player_id>,
+    /leaderboards/<season>/<goals|assists>?limit=N and /_stats.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+        pass
+
+    def send_json(self, status, payload):
+        body = json.dumps(_jsonable(payload), default=str).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        parts = url.path.strip("/").split("/")
+        query = {k: v[0] for k, v in parse_qs(url.query).items()}
+        try:
+            if parts == ["_stats"]:
+                return self.send_json(200, query_stats())
+            if len(parts) == 4 and parts[0] == "teams" and parts[2] == "seasons":
+                result = team_season_profile(int(parts[1]), int(parts[3]))
+            elif len(parts) == 2 and parts[0] == "players":
+                result = player_career(int(parts[1]))
+            elif len(parts) == 3 and parts[0] == "leaderboards" and parts[2] in ("goals", "assists"):
+                result = leaderboard(int(parts[1]), parts[2], int(query.get("limit", 10)))
+            else:
+                return self.send_json(404, {"error": "Unknown path."})
+        except ValueError:
+            return self.send_json(400, {"error": "IDs, seasons and limits must be integers."})
+        except psycopg2.Error as e:
+            print(f"Error running query for {self.path}: {e}")
+            return self.send_json(503, {"error": "Database unavailable."})
+        if result is None:
+            return self.send_json(404, {"error": "Not found."})
+        self.send_json(200, result)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Serve the dashboard queries over HTTP.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--check", action="store_true", help="only check that long invalidation tag lists fit into NOTIFY payloads")
+    args = parser.parse_args()
+    if args.check:
+        exit(0 if check_payloads() else 1)
+    start_invalidation_listener()
+    server = ThreadingHTTPServer((args.host, args.port), QueryHandler)
+    print(f"Dashboard queries listening on http://{args.host}:{server.server_port}", flush=True)
+    server.serve_forever()
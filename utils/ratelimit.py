@@ -0,0 +1,145 @@
+import os
+import time
+import threading
+from dotenv import load_dotenv
+from utils.metrics import metrics
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Our API-Football plan limits; the response headers override them at runtime.
+API_RATE_PER_MINUTE = int(os.getenv("API_RATE_PER_MINUTE", "30"))
+API_RATE_PER_DAY = int(os.getenv("API_RATE_PER_DAY", "7500"))
+
+class QuotaExhausted(Exception):
+    """Raised when the daily API request quota has been used up."""
+
+class TokenBucket:
+    """A thread-safe token bucket refilled at `rate` tokens per second."""
+
+    def __init__(self, rate, capacity=1):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+        self.hold_until = 0.0
+        self.lock = threading.Lock()
+
+    def _refill(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def acquire(self):
+        """Blocks until a token is available and takes it."""
+        while True:
+            with self.lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now >= self.hold_until and self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = max(self.hold_until - now, (1 - self.tokens) / self.rate)
+            time.sleep(wait)
+
+    def set_rate(self, rate):
+        """Changes the refill rate, keeping the tokens earned so far."""
+        with self.lock:
+            self._refill(time.monotonic())
+            self.rate = rate
+
+    def hold(self, seconds):
+        """Stops handing out tokens for the given number of seconds."""
+        with self.lock:
+            self.hold_until = max(self.hold_until, time.monotonic() + seconds)
+            self.tokens = 0
+
+class QuotaLimiter:
+    """Paces requests to the per-minute limit and stops at the per-day limit."""
+
+    def __init__(self, per_minute=API_RATE_PER_MINUTE, per_day=API_RATE_PER_DAY):
+        self.per_minute = per_minute
+        self.share = 1.0
+        #Share of the per-minute rate lent to worker processes, see reserve().
+        self.lent = 0.0
+        self.bucket = TokenBucket(per_minute / 60.0)
+        self.day_remaining = per_day
+        #Requests this process has made, for settling what workers spent.
+        self.used = 0
+        self.lock = threading.Lock()
+
+    def _pace(self):
+        self.bucket.set_rate(self.per_minute * (self.share - self.lent) / 60.0)
+
+    def set_share(self, share):
+        """Limits this process to a share of the plan, e.g. one worker among several."""
+        with self.lock:
+            self.share = share
+            self.day_remaining = int(self.day_remaining * share)
+        self._pace()
+
+    def reserve(self, share):
+        """Takes a share of the remaining requests and of the per-minute rate away from this process, for worker processes to spend.
+
+        Returns the number of requests reserved; settle() gives back what the workers did not use.
+        """
+        with self.lock:
+            requests = int(self.day_remaining * share)
+            self.day_remaining -= requests
+            self.lent = self.share * share
+        self._pace()
+        return requests
+
+    def settle(self, requests, used):
+        """Ends a reservation of `requests`, of which the workers used `used`, and restores the full rate."""
+        with self.lock:
+            self.day_remaining += max(0, requests - used)
+            self.lent = 0.0
+        self._pace()
+
+    def grant(self, requests):
+        """Sets the requests this process may still make, e.g. a worker's slice of the parent's reservation."""
+        with self.lock:
+            self.day_remaining = requests
+
+    def cap(self, requests):
+        """Stops this process after at most `requests` more requests, e.g. to keep part of the quota in reserve."""
+        with self.lock:
+            self.day_remaining = min(self.day_remaining, requests)
+
+    def acquire(self):
+        """Waits for a request slot, raising QuotaExhausted once the day's quota is gone."""
+        with self.lock:
+            if self.day_remaining <= 0:
+                raise QuotaExhausted("Daily API request quota exhausted.")
+            self.day_remaining -= 1
+            self.used += 1
+        self.bucket.acquire()
+
+    def update_from_headers(self, headers):
+        """Adjusts the pacing from the x-ratelimit-* headers of an API response."""
+        minute_limit = _int_header(headers, "x-ratelimit-limit")
+        minute_remaining = _int_header(headers, "x-ratelimit-remaining")
+        day_remaining = _int_header(headers, "x-ratelimit-requests-remaining")
+
+        if minute_limit and minute_limit != self.per_minute:
+            self.per_minute = minute_limit
+            self._pace()
+        #The minute window is spent, so wait for it to roll over instead of collecting 429s.
+        if minute_remaining == 0:
+            self.bucket.hold(60)
+        if day_remaining is not None:
+            metrics.set("api_quota_remaining", day_remaining)
+            with self.lock:
+                self.day_remaining = min(self.day_remaining, int(day_remaining * self.share))
+
+#Defining a function to read an integer header value.
+def _int_header(headers, name):
+    """Returns the header as an int, or None if it is missing or malformed."""
+    value = headers.get(name)
+    try:
+        return int(value) if value is not None else None
+    except ValueError:
+        return None
+
+#The limiter shared by every loader in this process.
+limiter = QuotaLimiter()
@@ -0,0 +1,109 @@
+import os
+import threading
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dotenv import load_dotenv
+from utils import config, sync, archive, checkpoint, profiling
+from utils.metrics import metrics
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Worker processes that work units are split across; 1 keeps everything in this process.
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", "1"))
+
+_executor = None
+_executor_lock = threading.Lock()
+#Held while one partition's slices run in the workers.
+_dispatch_lock = threading.Lock()
+
+#Defining a function to set up a worker process.
+def _init_worker(workers, options):
+    """Applies the parent's options and paces this worker to its share of the per-minute rate."""
+    from utils.ratelimit import limiter
+    config.LEAGUES = options["leagues"]
+    config.SEASONS = options["seasons"]
+    sync.FULL_REFRESH = options["full_refresh"]
+    archive.REPLAY = options["replay"]
+    checkpoint.RESUME = options["resume"]
+    profiling.PROFILE = options["profile"]
+    #The parent keeps one share for its own requests (team lists, /status) while the workers run.
+    limiter.set_share(1.0 / (workers + 1))
+
+#Defining a function to get the shared worker pool.
+def get_executor():
+    """Returns the process pool, started on first use with the options in force at that time."""
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            options = {
+                "leagues": config.LEAGUES,
+                "seasons": config.SEASONS,
+                "full_refresh": sync.FULL_REFRESH,
+                "replay": archive.REPLAY,
+                "resume": checkpoint.RESUME,
+                "profile": profiling.PROFILE,
+            }
+            #Spawned workers open their own DB pool, HTTP session, cache and archive files.
+            _executor = ProcessPoolExecutor(
+                max_workers=SHARD_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+                initargs=(SHARD_WORKERS, options),
+            )
+        return _executor
+
+#Defining a function to stop the worker pool.
+def shutdown():
+    """Stops the worker processes and waits for them to exit; the next sharded call starts a new pool."""
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=True)
+            _executor = None
+
+#Defining a function to run one slice in a worker process.
+def _run_slice(fn, partition, unit_ids, quota):
+    """Runs fn on a slice with `quota` API requests and returns its result, the metrics recorded meanwhile and the requests made."""
+    from utils.ratelimit import limiter
+    limiter.grant(quota)
+    used = limiter.used
+    #Each worker's slice is profiled as its own stage, as the parent cannot see into it.
+    with profiling.profile_stage(f"{fn.__name__}[{partition}]-{os.getpid()}"):
+        result = fn(partition, unit_ids)
+    return result, metrics.drain(), limiter.used - used
+
+#Defining a function to split work units across the worker processes.
+def run_sharded(fn, partition, unit_ids):
+    """Runs fn(partition, unit_ids) over one slice of the units per worker, or inline without workers.
+
+    fn must be a module-level function. Every write is an idempotent upsert, so
+    the workers' results merge in the database without coordination. Returns the
+    list of fn's return values, one per slice.
+
+    The workers spend from this process's quota: it lends them N/(N+1) of its
+    remaining requests and per-minute rate, split evenly across the slices, and
+    takes back the rate and the unused requests when they finish.
+    """
+    from utils.ratelimit import limiter
+    if SHARD_WORKERS <= 1 or len(unit_ids) < 2:
+        return [fn(partition, unit_ids)]
+    slices = [s for s in (unit_ids[i::SHARD_WORKERS] for i in range(SHARD_WORKERS)) if s]
+    executor = get_executor()
+    #Partitions take turns: one partition's slices keep every worker busy, and each reservation is settled before the next.
+    with _dispatch_lock:
+        reserved = limiter.reserve(SHARD_WORKERS / (SHARD_WORKERS + 1))
+        quotas = [reserved // len(slices) + (1 if i < reserved % len(slices) else 0) for i in range(len(slices))]
+        futures = [executor.submit(_run_slice, fn, partition, s, q) for s, q in zip(slices, quotas)]
+        results, used, settled = [], 0, 0
+        try:
+            for future, quota in zip(futures, quotas):
+                result, worker_metrics, spent = future.result()
+                metrics.merge(worker_metrics)
+                results.append(result)
+                used += spent
+                settled += quota
+        finally:
+            #A failed slice (and any still running after it) is assumed to have used its whole quota.
+            limiter.settle(reserved, used + reserved - settled)
+    return results
@@ -0,0 +1,149 @@
+import os
+import queue
+import threading
+from collections import Counter
+from dotenv import load_dotenv
+from utils.metrics import metrics, describe_rows
+from utils.profiling import inherit
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Records written to the database per batch.
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", "2000"))
+#Records allowed to wait for the writer; fetching pauses while the queue is full.
+STREAM_QUEUE_ROWS = int(os.getenv("STREAM_QUEUE_ROWS", "10000"))
+#Seconds the writer waits for more records before writing a partial batch.
+STREAM_FLUSH_SECONDS = float(os.getenv("STREAM_FLUSH_SECONDS", "2"))
+
+#Queue item that tells the writer to finish.
+_CLOSE = object()
+
+class _UnitDone:
+    """Queue item marking the end of a unit's records."""
+
+    __slots__ = ("unit_id", "season", "digest")
+
+    def __init__(self, unit_id, season, digest):
+        self.unit_id = unit_id
+        self.season = season
+        self.digest = digest
+
+class StreamWriter:
+    """Writes formatted records to the database in fixed-size batches on its own thread.
+
+    write(rows) receives a dict of record type -> list of records and returns True on
+    success. After every batch the sync tracker is flushed and the checkpoint committed,
+    so a unit only counts as done once all of its rows are in the database; a unit with
+    rows in a failed batch is marked failed when it finishes, even if its later batches
+    were written. `written` counts the records handed to write() per type, and `rows`
+    what the database did with them per (table, outcome).
+    """
+
+    def __init__(self, write, sync_tracker, checkpoint, batch_rows=STREAM_BATCH_ROWS, queue_rows=STREAM_QUEUE_ROWS):
+        self.write = write
+        self.sync_tracker = sync_tracker
+        self.checkpoint = checkpoint
+        self.batch_rows = batch_rows
+        self.queue = queue.Queue(maxsize=queue_rows)
+        self.written = Counter()
+        self.rows = Counter()
+        self.error = None
+        #Units that had records in a batch that could not be written.
+        self.failed_units = set()
+        self.thread = threading.Thread(target=inherit(self._drain), daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        #Whatever was queued before an interruption (quota, network, Ctrl-C) is still written.
+        self.close()
+
+    def _put(self, item):
+        #Blocks while the queue is full, so fetching slows down to the database's pace.
+        while True:
+            if self.error is not None:
+                raise self.error
+            try:
+                self.queue.put(item, timeout=1)
+                return
+            except queue.Full:
+                continue
+
+    def put_all(self, records, unit_id):
+        """Queues every record from an iterable, e.g. a formatter's generator, as part of a unit."""
+        for record in records:
+            self._put((unit_id, record))
+
+    def done(self, unit_id, season, digest):
+        """Marks a unit finished once every record queued before this call has been written."""
+        self._put(_UnitDone(unit_id, season, digest))
+
+    def close(self):
+        """Writes the remaining records and waits for the writer to finish."""
+        while self.thread.is_alive():
+            try:
+                self.queue.put(_CLOSE, timeout=1)
+                break
+            except queue.Full:
+                continue
+        self.thread.join()
+        if self.error is not None:
+            raise self.error
+
+    def report(self, table):
+        """Returns what the database did with the rows written to a table, e.g. "120 inserted, 40 unchanged"."""
+        return describe_rows(self.rows, table)
+
+    def _flush(self, batch, batch_units):
+        rows = {}
+        for record in batch:
+            rows.setdefault(type(record), []).append(record)
+        with metrics.span("stream_batch", writer=self.write.__name__):
+            with metrics.capture("db_rows", "table", "outcome") as outcomes:
+                written = self.write(rows)
+            if written:
+                self.sync_tracker.flush()
+                for record_type, records in rows.items():
+                    self.written[record_type.__name__] += len(records)
+                self.rows.update(outcomes)
+            else:
+                self.sync_tracker.discard()
+                self.failed_units.update(batch_units)
+            self.checkpoint.commit(written)
+
+    def _drain(self):
+        batch, batch_units, units = [], set(), 0
+        try:
+            while True:
+                try:
+                    item = self.queue.get(timeout=STREAM_FLUSH_SECONDS)
+                except queue.Empty:
+                    #Fetching has slowed down, so what is buffered is written now rather than held back.
+                    if batch or units:
+                        self._flush(batch, batch_units)
+                        batch, batch_units, units = [], set(), 0
+                    continue
+                if item is _CLOSE:
+                    break
+                if isinstance(item, _UnitDone):
+                    if item.unit_id in self.failed_units:
+                        #Some of its rows are missing, so it is retried rather than recorded as fetched.
+                        self.checkpoint.failed(item.unit_id, "some rows were not written")
+                    else:
+                        #A finished unit is committed with the batch holding its last records.
+                        self.sync_tracker.note(item.unit_id, item.season, item.digest)
+                        self.checkpoint.done(item.unit_id)
+                    units += 1
+                    continue
+                unit_id, record = item
+                batch.append(record)
+                batch_units.add(unit_id)
+                if len(batch) >= self.batch_rows:
+                    self._flush(batch, batch_units)
+                    batch, batch_units, units = [], set(), 0
+            self._flush(batch, batch_units)
+        except Exception as e:
+            self.error = e
@@ -0,0 +1,160 @@
+import os
+import json
+import hashlib
+import threading
+from datetime import datetime, timezone, timedelta
+from collections import defaultdict
+from dotenv import load_dotenv
+from utils.db import get_db_connection, bulk_upsert
+from utils import archive
+
+#Load environment variables from .env file.
+load_dotenv()
+
+#Defining a function to work out which season is still being played.
+def _default_current_season(today=None):
+    """Returns the season in progress; a season starts in July and is named after its first year."""
+    today = today or datetime.now(timezone.utc)
+    return today.year if today.month >= 7 else today.year - 1
+
+#Freshness policy: closed seasons are never refetched, the current season and
+#season-less entities (e.g. trophies) are refetched once they are older than their TTL.
+CURRENT_SEASON = int(os.getenv("CURRENT_SEASON", _default_current_season()))
+SYNC_CURRENT_TTL_HOURS = float(os.getenv("SYNC_CURRENT_TTL_HOURS", "24"))
+SYNC_SEASONLESS_TTL_HOURS = float(os.getenv("SYNC_SEASONLESS_TTL_HOURS", "168"))
+
+#Set by --full-refresh to ignore the sync state and refetch everything.
+FULL_REFRESH = False
+
+#Season value stored for requests that are not tied to a season.
+NO_SEASON = 0
+
+#Calls skipped, made and found unchanged, per endpoint, for the end-of-run report.
+SYNC_STATS = defaultdict(lambda: {"skipped": 0, "fetched": 0, "unchanged": 0})
+_stats_lock = threading.Lock()
+
+#Defining a function to hash an API payload.
+def content_hash(data):
+    """Returns a SHA-256 hash of the canonical JSON form of a payload."""
+    return hashlib.sha256(json.dumps(data, sort_keys=True, separators=(",", ":")).encode()).hexdigest()
+
+#Defining a function to decide whether a stored fetch is still fresh.
+def is_fresh(fetched_at, season, now=None):
+    """Applies the freshness policy to the time an entity was last fetched."""
+    if FULL_REFRESH or fetched_at is None:
+        return False
+    if season != NO_SEASON and season < CURRENT_SEASON:
+        return True
+    ttl_hours = SYNC_SEASONLESS_TTL_HOURS if season == NO_SEASON else SYNC_CURRENT_TTL_HOURS
+    now = now or datetime.now(timezone.utc)
+    return now - fetched_at < timedelta(hours=ttl_hours)
+
+class SyncTracker:
+    """Tracks when each (endpoint, entity, season) was last fetched and what it contained."""
+
+    def __init__(self, endpoint):
+        self.endpoint = endpoint
+        self.state = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        with get_db_connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(
+                    "SELECT entity_id, season, fetched_at, content_hash FROM sync_state WHERE endpoint = %s;",
+                    (endpoint,)
+                )
+                for entity_id, season, fetched_at, digest in cur.fetchall():
+                    self.state[(entity_id, season)] = (fetched_at, digest)
+
+    def _count(self, key):
+        with _stats_lock:
+            SYNC_STATS[self.endpoint][key] += 1
+
+    def is_fresh(self, entity_id, season=NO_SEASON):
+        """Returns True (and counts a skipped call) if the entity does not need refetching."""
+        fetched_at, _ = self.state.get((entity_id, season), (None, None))
+        if is_fresh(fetched_at, season):
+            self._count("skipped")
+            return True
+        return False
+
+    def entities(self, season=NO_SEASON):
+        """Returns the entities that have been fetched for a season before."""
+        return [e for (e, s) in self.state if s == season]
+
+    def stale(self, entity_ids, season=NO_SEASON):
+        """Returns the entities from the list that need refetching, never fetched and least recently fetched first.
+
+        season can also be a list; an entity is then stale if it is stale for any of them.
+        """
+        seasons = season if isinstance(season, list) else [season]
+        stale = []
+        for e in entity_ids:
+            if any(not is_fresh(self.state.get((e, s), (None, None))[0], s) for s in seasons):
+                stale.append(e)
+            else:
+                #One skipped call per entity that is fresh for every season and so not fetched.
+                self._count("skipped")
+        #If the quota runs out partway, the entities that were most out of date have been refreshed.
+        def last_fetched(e):
+            fetched = [self.state.get((e, s), (None, None))[0] for s in seasons]
+            return (0, None) if None in fetched else (1, min(fetched))
+        return sorted(stale, key=last_fetched)
+
+    def check(self, entity_id, season, data):
+        """Counts a successful fetch and returns (whether its rows need writing, its content hash).
+
+        season can also be a list, for one fetch that covers several seasons.
+        """
+        digest = content_hash(data)
+        seasons = season if isinstance(season, list) else [season]
+        changed = any(self.state.get((entity_id, s), (None, None))[1] != digest for s in seasons)
+        self._count("fetched")
+        if not changed:
+            self._count("unchanged")
+        return FULL_REFRESH or changed, digest
+
+    def note(self, entity_id, season, digest):
+        """Queues a checked fetch to be saved by the next flush."""
+        with self.lock:
+            self.pending[(entity_id, season)] = (datetime.now(timezone.utc), digest)
+
+    def record(self, entity_id, season, data):
+        """Notes a successful fetch and returns whether its rows need writing (new or changed content)."""
+        changed, digest = self.check(entity_id, season, data)
+        self.note(entity_id, season, digest)
+        return changed
+
+    def flush(self):
+        """Writes the recorded fetches to sync_state; call it once their rows are in the database."""
+        with self.lock:
+            pending, self.pending = self.pending, {}
+        #Replayed responses are not new fetches, so they must not make anything look fresh.
+        if not pending or archive.REPLAY:
+            return
+        rows = [(self.endpoint, e, s, fetched_at, digest) for (e, s), (fetched_at, digest) in pending.items()]
+        try:
+            with get_db_connection() as conn:
+                with conn.cursor() as cur:
+                    bulk_upsert(cur, "sync_state",
+                                ["endpoint", "entity_id", "season", "fetched_at", "content_hash"],
+                                rows, ["endpoint", "entity_id", "season"],
+                                update_columns=["fetched_at", "content_hash"])
+                    conn.commit()
+            self.state.update(pending)
+        except Exception as e:
+            print(f"Error saving sync state for {self.endpoint}: {e}")
+
+    def discard(self):
+        """Forgets the recorded fetches, e.g. because writing their rows failed."""
+        with self.lock:
+            self.pending = {}
+
+#Defining a function to format the skipped-versus-made report.
+def sync_report():
+    """Returns one line per endpoint with the calls skipped, made and unchanged."""
+    with _stats_lock:
+        return [
+            f"/{endpoint}: {s['fetched']} made, {s['skipped']} skipped as fresh, {s['unchanged']} unchanged"
+            for endpoint, s in sorted(SYNC_STATS.items())
+        ]